@@ -2,6 +2,8 @@
 """
 Route module for the API
 """
+from api.v1.auth.auth import ExcludedPaths
+from api.v1.auth.metrics import timer
 from api.v1.views import app_views
 from flask import Flask, abort, jsonify, request
 from flask_cors import (CORS, cross_origin)
@@ -12,7 +14,10 @@ app.register_blueprint(app_views)
 CORS(app, resources={r"/api/v1/*": {"origins": "*"}})
 
 auth = None     # stores the type of authentication to use
-if getenv('AUTH_TYPE') == 'session_db_auth':
+if getenv('AUTH_TYPE') == 'session_signed_auth':
+    from api.v1.auth.session_signed_auth import SessionSignedAuth
+    auth = SessionSignedAuth()
+elif getenv('AUTH_TYPE') == 'session_db_auth':
     from api.v1.auth.session_db_auth import SessionDBAuth
     auth = SessionDBAuth()
 elif getenv('AUTH_TYPE') == 'session_exp_auth':
@@ -27,6 +32,10 @@ elif getenv('AUTH_TYPE') == 'basic_auth':
 elif getenv('AUTH_TYPE') == 'auth':
     from api.v1.auth.auth import Auth
     auth = Auth()
+# routes that doesn't require authorization
+excluded_paths = ExcludedPaths(['/api/v1/status/', '/api/v1/unauthorized/',
+                                '/api/v1/forbidden/',
+                                '/api/v1/auth_session/login/'])
 
 
 @app.before_request
@@ -34,10 +43,9 @@ def authentication_filter():
     """Checks if request path requires authentication."""
     if auth is None:
         return
-    # routes that doesn't require authorization
-    excluded_paths = ['/api/v1/status/', '/api/v1/unauthorized/',
-                      '/api/v1/forbidden/', '/api/v1/auth_session/login/']
-    if not auth.require_auth(request.path, excluded_paths):  # path in `exclud`
+    with timer('path_match'):
+        required = auth.require_auth(request.path, excluded_paths)
+    if not required:  # path in `excluded_paths`
         return
     if auth.authorization_header(request) is None and\
             auth.session_cookie(request) is None:
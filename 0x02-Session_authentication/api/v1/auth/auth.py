@@ -2,31 +2,65 @@
 """Class to manage API Authentication
 """
 from flask import request
-from typing import List, TypeVar, Union
+from functools import lru_cache
+from typing import Iterable, List, TypeVar, Union
 from os import getenv
 
 
+class ExcludedPaths:
+    """Excluded paths compiled for `Auth.require_auth`: a set of the exact
+    paths and a trie of the prefixes of the paths ending with '*', so a
+    lookup doesn't depend on the number of paths.
+    """
+    def __init__(self, excluded_paths: Iterable[str]):
+        """Compile `excluded_paths`."""
+        self.exact = set()
+        self.prefixes = {}  # trie: `{<char>: {...}}`, `None` ends a prefix
+        for excl_path in excluded_paths:
+            if excl_path.endswith('*'):
+                node = self.prefixes
+                for char in excl_path.strip('*'):
+                    node = node.setdefault(char, {})
+                node[None] = True
+            else:
+                self.exact.add(excl_path)
+
+    def __contains__(self, path: str) -> bool:
+        """Returns `True` if `path` is excluded."""
+        if path in self.exact:
+            return True
+        node = self.prefixes
+        for char in path:
+            if None in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return None in node
+
+
+@lru_cache(maxsize=32)
+def compile_excluded_paths(excluded_paths: tuple) -> ExcludedPaths:
+    """Returns the `ExcludedPaths` of `excluded_paths`, compiled once."""
+    return ExcludedPaths(excluded_paths)
+
+
 class Auth:
     """Template for all authentication system in the API.
     """
     def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
         """Checks if authentication is required. Returns `True` if `path`
         is not in `excluded_paths`, otherwise returns `False`.
-        Excluded paths can contain the regex character '*' at the end."""
+        Excluded paths can contain the regex character '*' at the end.
+        `excluded_paths` can be compiled once with `ExcludedPaths`,
+        otherwise it is compiled on the first call with the same paths."""
         if path is None or not excluded_paths:
             return True
+        if not isinstance(excluded_paths, ExcludedPaths):
+            excluded_paths = compile_excluded_paths(tuple(excluded_paths))
         if not path.endswith('/'):
             path += '/'
-        # return True if path is not in excluded_paths
-        for excl_path in excluded_paths:
-            if excl_path.endswith('*'):
-                excl_path = excl_path.strip('*')
-                if path.startswith(excl_path):
-                    return False
-            else:
-                if excl_path == path:
-                    return False
-        return True
+        return path not in excluded_paths
 
     def authorization_header(self, request=None) -> Union[str, None]:
         """Returns the `Authorization` header value in `request`."""
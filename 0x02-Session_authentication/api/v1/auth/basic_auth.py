@@ -2,13 +2,39 @@
 """Basic authentication
 """
 from api.v1.auth.auth import Auth
+from api.v1.auth.metrics import timer
 from base64 import b64decode
+from collections import OrderedDict
 from models.user import User
 from typing import Tuple, TypeVar, Union
+from os import getenv
+import hashlib
+import hmac
+import os
+import threading
+import time
 
 
 class BasicAuth(Auth):
     """Implements a basic authentication."""
+    def __init__(self):
+        """Initialize instance with an empty cache of verified
+        credentials: `{<digest of Authorization header>: (<user id>,
+        <email>, <password hash>, <expiry>)}`, least recently used first.
+        """
+        try:
+            self.cache_size = int(getenv('BASIC_AUTH_CACHE_SIZE'))
+        except (TypeError, ValueError):
+            self.cache_size = 1024
+        try:
+            self.cache_ttl = float(getenv('BASIC_AUTH_CACHE_TTL'))
+        except (TypeError, ValueError):
+            self.cache_ttl = 60
+        # headers are only kept as digests keyed with a per-process secret
+        self._cache_key = os.urandom(32)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
     def extract_base64_authorization_header(
             self, authorization_header: str) -> Union[str, None]:
         """Returns the `Base64` part of the `Authorization` header for a
@@ -54,24 +80,77 @@ class BasicAuth(Auth):
                 user_pwd is None or type(user_pwd) != str:
             return None
         try:
-            user = User.search({'email': user_email})[0]
+            with timer('store_lookup'):
+                user = User.search({'email': user_email})[0]
         except (IndexError, KeyError):    # no user instance in db
             return None
 
-        if not user.is_valid_password(user_pwd):
+        with timer('password_verify'):
+            if not user.is_valid_password(user_pwd):
+                return None
+        return user
+
+    def header_digest(self, authorization_header: str) -> bytes:
+        """Returns the key of `authorization_header` in the cache."""
+        return hmac.new(self._cache_key, authorization_header.encode(),
+                        hashlib.sha256).digest()
+
+    def cached_user(self, digest: bytes) -> TypeVar('User'):  # type: ignore
+        """Returns the User whose credentials were verified for the
+        header of `digest`, unless the entry expired or the user was
+        removed or changed its email or password since."""
+        with self._cache_lock:
+            entry = self._cache.get(digest)
+            if entry is None:
+                return None
+            if entry[3] < time.monotonic():
+                del self._cache[digest]
+                return None
+            self._cache.move_to_end(digest)
+        user_id, email, password, _ = entry
+        user = User.get(user_id)
+        if user is None or user.email != email or user.password != password:
+            with self._cache_lock:
+                self._cache.pop(digest, None)
             return None
         return user
 
+    def cache_user(self, digest: bytes, user: TypeVar('User')):  # type: ignore
+        """Stores `user` as verified for the header of `digest`, evicting
+        the least recently used entry if the cache is full."""
+        entry = (user.id, user.email, user.password,
+                 time.monotonic() + self.cache_ttl)
+        with self._cache_lock:
+            self._cache[digest] = entry
+            self._cache.move_to_end(digest)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
     def current_user(self, request=None) -> TypeVar('User'):    # type: ignore
-        """Returns the current user."""
+        """Returns the current user.
+        Users verified recently are found from the cache, without decoding
+        the header and checking the password again."""
         # extract Authorization header value
         aut_header = self.authorization_header(request)
-        # get part of Authorization value after word `Base `
-        base64_aut_hdr = self.extract_base64_authorization_header(aut_header)
-        # decode value from base 64
-        decoded_hdr = self.decode_base64_authorization_header(base64_aut_hdr)
-        # get email and password values
-        email, password = self.extract_user_credentials(decoded_hdr)
+        digest = None
+        if self.cache_size > 0 and type(aut_header) is str:
+            # its own stage: the other ones are still timed on a miss
+            with timer('cache_lookup'):
+                digest = self.header_digest(aut_header)
+                user = self.cached_user(digest)
+            if user is not None:
+                return user
+        with timer('header_decode'):
+            # get part of Authorization value after word `Base `
+            base64_aut_hdr = self.extract_base64_authorization_header(
+                aut_header)
+            # decode value from base 64
+            decoded_hdr = self.decode_base64_authorization_header(
+                base64_aut_hdr)
+            # get email and password values
+            email, password = self.extract_user_credentials(decoded_hdr)
         # get user
         user = self.user_object_from_credentials(email, password)
+        if user is not None and digest is not None:
+            self.cache_user(digest, user)
         return user
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Latency histograms of the stages of the authentication of requests,
+exposed in the Prometheus text format (enabled by `AUTH_METRICS=1`)
+"""
+from bisect import bisect_left
+from contextlib import nullcontext
+from os import getenv
+import threading
+import time
+
+
+ENABLED = getenv('AUTH_METRICS') == '1'
+# upper bounds (seconds) of the buckets of the histograms
+BUCKETS = (1e-06, 5e-06, 1e-05, 5e-05, 0.0001, 0.0005, 0.001, 0.005,
+           0.01, 0.05, 0.1, 0.5, 1.0)
+STAGES = ('path_match', 'cache_lookup', 'header_decode', 'store_lookup',
+          'password_verify')
+
+
+class Histogram:
+    """Number of observations per bucket of `BUCKETS` (the last one for
+    the values above all bounds), with their sum."""
+    def __init__(self):
+        """Initialize an empty histogram."""
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        """Adds an observation of `seconds`."""
+        i = bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+
+
+# `{<stage>: <Histogram>}`
+HISTOGRAMS = {stage: Histogram() for stage in STAGES}
+
+
+class _Timer:
+    """Context manager adding the time spent in its block to the
+    histogram of a stage."""
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+_NO_TIMER = nullcontext()
+
+
+def timer(stage: str):
+    """Returns a context manager timing its block as `stage`, one doing
+    nothing if the metrics are disabled."""
+    if not ENABLED:
+        return _NO_TIMER
+    return _Timer(HISTOGRAMS[stage])
+
+
+def render() -> str:
+    """Returns the histograms in the Prometheus text format."""
+    name = 'auth_stage_duration_seconds'
+    lines = ['# HELP {} Time spent in each stage of the authentication of '
+             'requests.'.format(name),
+             '# TYPE {} histogram'.format(name)]
+    for stage, histogram in HISTOGRAMS.items():
+        with histogram._lock:
+            counts = list(histogram.counts)
+            total = histogram.sum
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), counts):
+            cumulative += count
+            lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(
+                name, stage, bound, cumulative))
+        lines.append('{}_sum{{stage="{}"}} {!r}'.format(name, stage, total))
+        lines.append('{}_count{{stage="{}"}} {}'.format(
+            name, stage, cumulative))
+    return '\n'.join(lines) + '\n'
@@ -2,8 +2,11 @@
 """Session authentication
 """
 from api.v1.auth.auth import Auth
+from api.v1.auth.metrics import timer
+from api.v1.auth.session_store import new_session_store
 from models.user import User
 from typing import Union
+from os import getenv
 from uuid import uuid4
 
 
@@ -12,6 +15,13 @@ class SessionAuth(Auth):
     # stores `<session_id>:<user_id>` key, value pairs
     user_id_by_session_id = {}
 
+    def __init__(self):
+        """Initialize instance: with `SESSION_STORE` set, sessions are
+        kept in that store (see `session_store.new_session_store`)
+        instead of `user_id_by_session_id` of the class."""
+        if getenv('SESSION_STORE') is not None:
+            self.user_id_by_session_id = new_session_store()
+
     def create_session(self, user_id: str = None) -> Union[str, None]:
         """Creates a session id for `user_id` and stores it in
         `user_id_by_session_id`. Returns the created session id."""
@@ -32,10 +42,11 @@ class SessionAuth(Auth):
         """Returns a `User` instance based on a cookie value for seesion id."""
         # get session id from cookie
         session_id = self.session_cookie(request)
-        # get user id
-        user_id = self.user_id_for_session_id(session_id)
-        # get user
-        user = User.get(user_id)
+        with timer('store_lookup'):
+            # get user id
+            user_id = self.user_id_for_session_id(session_id)
+            # get user
+            user = User.get(user_id)
         return user
 
     def destroy_session(self, request=None):
@@ -50,6 +61,6 @@ class SessionAuth(Auth):
         user_id = self.user_id_for_session_id(session_id)
         if user_id is None:
             return False
-        # logout by deleting session id entry
-        del self.user_id_by_session_id[session_id]
+        # logout by deleting session id entry (unless it just expired)
+        self.user_id_by_session_id.pop(session_id, None)
         return True
@@ -4,15 +4,44 @@
 from api.v1.auth.session_exp_auth import SessionExpAuth
 from datetime import datetime, timedelta
 from models.user_session import UserSession
-from typing import Union
+from typing import Tuple, Union
 from os import getenv
 from uuid import uuid4
+import logging
+import threading
+import time
 
 
 class SessionDBAuth(SessionExpAuth):
     """Implements a session authentication with expiration
     based on Session ID stored in database."""
 
+    def __init__(self):
+        """Initialize instance, with an empty cache of the sessions read
+        from database: `{<session_id>: (<user_id>, <created_at>,
+        <updated_at>)}`, valid while the files of `UserSession` keep the
+        same `file_keys`. With sliding expiration, a session expires
+        `session_duration` after its `updated_at` (last seen)."""
+        super().__init__()
+        self.sessions_cache = {}
+        self._cache_keys = None
+        self._destroyed = 0     # sessions destroyed by this instance
+        self._cache_lock = threading.Lock()
+        # `{<session_id>: <last seen>}` not saved yet: the requests only
+        # record it, it is saved every `refresh_interval` seconds
+        self._last_seen = {}
+        if self.session_duration > 0 and self.refresh_interval > 0:
+            threading.Thread(target=self._last_seen_loop,
+                             daemon=True).start()
+        # expired sessions are purged every `sweep_interval` seconds
+        self.last_purge = None
+        if self.session_duration > 0 and self.sweep_interval > 0:
+            threading.Thread(target=self._purge_loop, daemon=True).start()
+
+    def new_store(self, max_size: int) -> None:
+        """No store of the sessions: they are `UserSession` records."""
+        return None
+
     def create_session(self, user_id: str = None) -> Union[str, None]:
         """Creates and stores new instance of UserSession
         and returns the Session ID."""
@@ -24,31 +53,146 @@ class SessionDBAuth(SessionExpAuth):
             'session_id': session_id,
         }
         user_session = UserSession(**session_dict)
-        user_session.save()
+        self._own_write(user_session.save)
+        with self._cache_lock:
+            self.sessions_cache[session_id] = (
+                user_id, user_session.created_at, user_session.updated_at)
         return session_id
 
-    def user_id_for_session_id(
-            self, session_id: str = None) -> Union[str, None]:
-        """Returns `user_id` based on `session_id`."""
-        if session_id is None or type(session_id) != str:
-            return None
+    def _own_write(self, write):
+        """Calls `write`, a write of UserSession records by this instance:
+        it changes `file_keys`, but the cache stays valid if it was up to
+        date before (the writer updates the cache itself)."""
+        keys = UserSession.file_keys()
+        result = write()
+        with self._cache_lock:
+            if self._cache_keys == keys:
+                self._cache_keys = UserSession.file_keys()
+        return result
+
+    def cached_session(
+            self, session_id: str) -> Union[Tuple[str, datetime, datetime],
+                                            None]:
+        """Returns the `(<user_id>, <created_at>, <updated_at>)` of the
+        UserSession `session_id`, from the cache unless the files changed
+        since."""
+        keys = UserSession.file_keys()
+        with self._cache_lock:
+            if keys != self._cache_keys:
+                self.sessions_cache = {}
+                self._cache_keys = keys
+            session = self.sessions_cache.get(session_id)
+            destroyed = self._destroyed
+        if session is not None:
+            return session
         try:
             UserSession.load_from_file()
             user_session = UserSession.search({'session_id': session_id})[0]
         except (KeyError, IndexError):
             return None     # no user session for given session_id
+        session = (user_session.user_id, user_session.created_at,
+                   user_session.updated_at)
+        with self._cache_lock:
+            # not if it may have been destroyed since it was read
+            if self._cache_keys == keys and self._destroyed == destroyed:
+                self.sessions_cache[session_id] = session
+        return session
+
+    def user_id_for_session_id(
+            self, session_id: str = None) -> Union[str, None]:
+        """Returns `user_id` based on `session_id`."""
+        if session_id is None or type(session_id) != str:
+            return None
+        session = self.cached_session(session_id)
+        if session is None:
+            return None
+        user_id, created_at, updated_at = session
 
         if self.session_duration <= 0:  # no expiration time set
-            return user_session.user_id
+            return user_id
 
-        created_at = user_session.created_at
         if created_at is None:
             return None
 
+        now = datetime.utcnow()
+        seen_at = created_at
+        if self.refresh_interval > 0:   # sliding expiration
+            seen_at = max(updated_at or created_at,
+                          self._last_seen.get(session_id, created_at))
         expire_after = timedelta(seconds=self.session_duration)
-        if created_at + expire_after < datetime.utcnow():  # already expired
+        if seen_at + expire_after < now:  # already expired
             return None
-        return user_session.user_id
+        if self.refresh_interval > 0 and \
+                (now - seen_at).total_seconds() >= self.refresh_interval:
+            self._last_seen[session_id] = now
+        return user_id
+
+    def save_last_seen(self) -> int:
+        """Saves the last seen time of the sessions seen since the last
+        call as their `updated_at`, in one write. Returns how many."""
+        with self._cache_lock:
+            last_seen, self._last_seen = self._last_seen, {}
+            # the files may not change before long (`DB_FLUSH_INTERVAL`)
+            for session_id, seen_at in last_seen.items():
+                session = self.sessions_cache.get(session_id)
+                if session is not None:
+                    self.sessions_cache[session_id] = session[:2] + (
+                        max(session[2] or seen_at, seen_at),)
+        if not last_seen:
+            return 0
+        UserSession.load_from_file()
+        user_sessions = []
+        for session_id, seen_at in last_seen.items():
+            for user_session in UserSession.search(
+                    {'session_id': session_id}):
+                if user_session.updated_at is None or \
+                        user_session.updated_at < seen_at:
+                    user_session.updated_at = seen_at
+                    user_sessions.append(user_session)
+        self._own_write(lambda: UserSession.save_many(user_sessions,
+                                                      touch=False))
+        return len(user_sessions)
+
+    def _last_seen_loop(self):
+        """Calls `save_last_seen` every `refresh_interval` seconds."""
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.save_last_seen()
+            except Exception:   # saved again at the next call
+                logging.getLogger(__name__).exception(
+                    "saving the last seen times failed, retrying in %ss",
+                    self.refresh_interval)
+
+    def purge_expired_sessions(self) -> dict:
+        """Removes the expired UserSession records in one write. Returns
+        (and keeps in `last_purge`) how many and how long it took."""
+        start = time.perf_counter()
+        purged = 0
+        if self.session_duration > 0 and self.refresh_interval > 0:
+            self.save_last_seen()
+            purged = UserSession.purge_expired(self.session_duration,
+                                               'updated_at')
+        elif self.session_duration > 0:
+            purged = UserSession.purge_expired(self.session_duration)
+        self.last_purge = {
+            'purged': purged,
+            'seconds': time.perf_counter() - start,
+            'at': datetime.utcnow().isoformat(timespec='seconds'),
+        }
+        return self.last_purge
+
+    def _purge_loop(self):
+        """Calls `purge_expired_sessions` every `sweep_interval`
+        seconds."""
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.purge_expired_sessions()
+            except Exception:   # purged at the next sweep
+                logging.getLogger(__name__).exception(
+                    "purging the expired sessions failed, retrying in %ss",
+                    self.sweep_interval)
 
     def destroy_session(self, request=None):
         """Deletes the user session / logout."""
@@ -65,5 +209,8 @@ class SessionDBAuth(SessionExpAuth):
         except (KeyError, IndexError):
             return False     # no user session for given session_id
         # logout by deleting user_session
-        user_session.remove()
+        self._own_write(user_session.remove)
+        with self._cache_lock:
+            self.sessions_cache.pop(session_id, None)
+            self._destroyed += 1
         return True
@@ -2,7 +2,8 @@
 """Session authentication with expiration
 """
 from api.v1.auth.session_auth import SessionAuth
-from datetime import datetime, timedelta
+from api.v1.auth.session_store import new_session_store
+from datetime import datetime
 from typing import Union
 from os import getenv
 
@@ -10,11 +11,34 @@ from os import getenv
 class SessionExpAuth(SessionAuth):
     """Implements a session authentication with expiration."""
     def __init__(self):
-        """Initialize instance."""
+        """Initialize instance, with its own store of sessions that
+        removes them once expired (selected by `SESSION_STORE`)."""
         try:
             self.session_duration = int(getenv('SESSION_DURATION'))
         except (TypeError, ValueError):
             self.session_duration = 0
+        try:
+            max_size = int(getenv('SESSION_STORE_SIZE'))
+        except (TypeError, ValueError):
+            max_size = 100000
+        try:
+            self.sweep_interval = float(getenv('SESSION_SWEEP_INTERVAL'))
+        except (TypeError, ValueError):
+            self.sweep_interval = 60
+        # sliding expiration: sessions used again at least
+        # `refresh_interval` seconds after they were last stored are
+        # stored again, which restarts their duration (`0`: fixed)
+        try:
+            self.refresh_interval = float(getenv('SESSION_REFRESH_INTERVAL'))
+        except (TypeError, ValueError):
+            self.refresh_interval = 0
+        self.user_id_by_session_id = self.new_store(max_size)
+
+    def new_store(self, max_size: int):
+        """Returns the store of the sessions, keeping at most `max_size`
+        of them."""
+        return new_session_store(self.session_duration, max_size,
+                                 self.sweep_interval)
 
     def create_session(self, user_id: str = None) -> Union[str, None]:
         """Creates a session id for `user_id` and stores it in
@@ -34,18 +58,15 @@ class SessionExpAuth(SessionAuth):
         """Returns `user_id` based on `session_id`."""
         if session_id is None or type(session_id) != str:
             return None
+        # expired sessions are removed by the store
         session_dict = self.user_id_by_session_id.get(session_id)
         if session_dict is None:
             return None
-
-        if self.session_duration <= 0:  # no expiration time set
-            return session_dict['user_id']
-
-        created_at = session_dict.get('created_at')
-        if created_at is None:
-            return None
-
-        expire_after = timedelta(seconds=self.session_duration)
-        if created_at + expire_after < datetime.now():  # already expired
-            return None
+        if self.refresh_interval > 0:
+            now = datetime.now()
+            last_seen = session_dict.get('last_seen',
+                                         session_dict['created_at'])
+            if (now - last_seen).total_seconds() >= self.refresh_interval:
+                session_dict['last_seen'] = now
+                self.user_id_by_session_id[session_id] = session_dict
         return session_dict['user_id']
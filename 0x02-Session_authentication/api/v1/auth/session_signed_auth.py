@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Stateless session authentication with signed session cookies
+"""
+from api.v1.auth.auth import Auth
+from api.v1.auth.metrics import timer
+from api.v1.auth.session_store import SQLiteSessionStore
+from models.user import User
+from typing import Union
+from os import getenv
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+
+
+class SessionSignedAuth(Auth):
+    """Implements a session authentication without session store: the
+    session id is `<user id>.<expiry>.<key id>.<signature>`, the expiry
+    a Unix time in milliseconds and the signature the HMAC-SHA256 of the
+    user id and expiry, so any process with the same keys verifies it.
+    A logout revokes the session and the older sessions of the user:
+    their expiry is at most the one kept for the user in
+    `revoked_before`, checked in memory.
+    """
+    def __init__(self):
+        """Initialize instance: `SESSION_SECRET` holds the comma separated
+        keys, the first one signs new sessions and all of them verify
+        (a random key of this process if unset). `SESSION_DURATION` is
+        required: revocations are kept until the sessions expire."""
+        keys = [secret.encode() for secret in
+                getenv('SESSION_SECRET', '').split(',') if secret]
+        if not keys:
+            keys = [os.urandom(32)]
+        self.keys = {self.key_id(key): key for key in keys}
+        self.signing_key_id = self.key_id(keys[0])
+        try:
+            self.session_duration = int(getenv('SESSION_DURATION'))
+        except (TypeError, ValueError):
+            self.session_duration = 0
+        if self.session_duration <= 0:
+            raise ValueError("session_signed_auth requires a positive "
+                             "SESSION_DURATION")
+        try:
+            sweep_interval = float(getenv('SESSION_SWEEP_INTERVAL'))
+        except (TypeError, ValueError):
+            sweep_interval = 60
+        try:
+            self.sync_interval = float(getenv('SESSION_SYNC_INTERVAL'))
+        except (TypeError, ValueError):
+            self.sync_interval = 1
+        # `{<user id>: <expiry>}`: the sessions of the user expiring at
+        # or before it are revoked, one entry per user
+        self.revoked_before = {}
+        self._lock = threading.Lock()
+        # the logouts are shared with the other processes of the host
+        # through this store (`SESSION_STORE=memory`: not shared), read
+        # every `sync_interval` seconds in the background
+        self.revocations = None
+        if getenv('SESSION_STORE', 'sqlite') == 'sqlite':
+            self.revocations = SQLiteSessionStore(
+                getenv('SESSION_STORE_PATH', '.db_sessions.sqlite3'),
+                self.session_duration + 1, 0, sweep_interval)
+        self._synced_at = 0
+        if self.sync_interval > 0:
+            threading.Thread(target=self._sync_loop, daemon=True).start()
+
+    @staticmethod
+    def key_id(key: bytes) -> str:
+        """Returns the id of `key` written in the session ids it signs."""
+        return hashlib.sha256(key).hexdigest()[:8]
+
+    @staticmethod
+    def sign(key: bytes, user_id: str, expiry: int) -> str:
+        """Returns the signature of `user_id` and `expiry` with `key`."""
+        message = '{}.{}'.format(user_id, expiry).encode()
+        digest = hmac.new(key, message, hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+    def create_session(self, user_id: str = None) -> Union[str, None]:
+        """Creates a session id signed for `user_id`."""
+        if user_id is None or type(user_id) != str:
+            return None
+        expiry = int((time.time() + self.session_duration) * 1000)
+        # after a logout in the same millisecond: not revoked
+        expiry = max(expiry, self.revoked_before.get(user_id, 0) + 1)
+        signature = self.sign(self.keys[self.signing_key_id], user_id,
+                              expiry)
+        return '{}.{}.{}.{}'.format(user_id, expiry, self.signing_key_id,
+                                    signature)
+
+    def verify_session(self, session_id: str = None) -> Union[tuple, None]:
+        """Returns the `(<user id>, <expiry>)` of `session_id` if its
+        signature is valid (compared in constant time) and it hasn't
+        expired, otherwise `None`."""
+        if session_id is None or type(session_id) != str:
+            return None
+        try:
+            user_id, expiry, key_id, signature = session_id.rsplit('.', 3)
+            expiry = int(expiry)
+        except ValueError:
+            return None
+        key = self.keys.get(key_id)
+        if key is None:     # unknown or retired key
+            return None
+        try:
+            # as bytes: strings with non-ASCII characters can't be compared
+            valid = hmac.compare_digest(
+                self.sign(key, user_id, expiry).encode(), signature.encode())
+        except UnicodeEncodeError:  # e.g. lone surrogates
+            return None
+        if not valid or expiry < time.time() * 1000:
+            return None
+        return user_id, expiry
+
+    def is_revoked(self, user_id: str, expiry: int) -> bool:
+        """Returns `True` if the session of `user_id` expiring at `expiry`
+        was logged out, from memory only."""
+        return expiry <= self.revoked_before.get(user_id, 0)
+
+    def revoke(self, user_id: str, expiry: int):
+        """Revokes the sessions of `user_id` expiring at or before
+        `expiry` in this process."""
+        with self._lock:
+            if expiry > self.revoked_before.get(user_id, 0):
+                self.revoked_before[user_id] = expiry
+
+    def sync_revocations(self):
+        """Reads the logouts of the other processes stored since the last
+        call, and forgets the revocations of expired sessions."""
+        if self.revocations is not None:
+            since = self._synced_at
+            self._synced_at = time.time()
+            # a second earlier: writes committed meanwhile aren't missed
+            for _, (user_id, expiry) in self.revocations.items_since(
+                    since - 1):
+                self.revoke(user_id, expiry)
+        now = time.time() * 1000
+        with self._lock:
+            for user_id in [user_id for user_id, expiry
+                            in self.revoked_before.items() if expiry < now]:
+                del self.revoked_before[user_id]
+
+    def _sync_loop(self):
+        """Calls `sync_revocations` every `sync_interval` seconds."""
+        while True:
+            try:
+                self.sync_revocations()
+            except Exception:
+                logging.getLogger(__name__).exception(
+                    "revocations sync failed, retrying in %ss",
+                    self.sync_interval)
+            time.sleep(self.sync_interval)
+
+    def user_id_for_session_id(
+            self, session_id: str = None) -> Union[str, None]:
+        """Returns `user_id` based on `session_id`."""
+        verified = self.verify_session(session_id)
+        if verified is None or self.is_revoked(*verified):
+            return None
+        return verified[0]
+
+    def current_user(self, request=None) -> Union[User, None]:
+        """Returns a `User` instance based on a cookie value for seesion id."""
+        with timer('header_decode'):
+            verified = self.verify_session(self.session_cookie(request))
+        if verified is None:
+            return None
+        if self.is_revoked(*verified):
+            return None
+        with timer('store_lookup'):
+            return User.get(verified[0])
+
+    def destroy_session(self, request=None):
+        """Revokes the user session / logout."""
+        if request is None:
+            return False
+        verified = self.verify_session(self.session_cookie(request))
+        if verified is None:
+            return False
+        user_id, expiry = verified
+        if self.is_revoked(user_id, expiry):
+            return False
+        self.revoke(user_id, expiry)
+        if self.revocations is not None:
+            key = '{}.{}'.format(user_id, expiry)
+            self.revocations[key] = [user_id, expiry]
+        return True
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""Session stores: in memory, or in a SQLite file shared by the
+processes of a host
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from os import getenv
+import heapq
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+
+class SessionStore(ABC):
+    """Interface of the stores of sessions `{<session id>: <session>}`
+    used by `SessionAuth`. Sessions expire `duration` seconds after they
+    are stored (never if `duration` <= 0), and at most `max_size` of them
+    are kept (no limit if `max_size` <= 0).
+    Expired sessions are removed when accessed, and every `sweep_interval`
+    seconds by a background thread.
+    """
+    def __init__(self, duration: int = 0, max_size: int = 0,
+                 sweep_interval: float = 60):
+        """Initialize the settings and counters of the store."""
+        self.duration = duration
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+        self.expired = 0    # sessions removed because they expired
+        self.evicted = 0    # sessions removed to stay under `max_size`
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of sessions stored."""
+
+    def __contains__(self, session_id: str) -> bool:
+        """Returns `True` if `session_id` is a live session."""
+        return self.get(session_id) is not None
+
+    @abstractmethod
+    def __setitem__(self, session_id: str, session):
+        """Stores `session`, replacing any session with the same id."""
+
+    def __delitem__(self, session_id: str):
+        """Removes the session `session_id`."""
+        missing = object()
+        if self.pop(session_id, missing) is missing:
+            raise KeyError(session_id)
+
+    @abstractmethod
+    def get(self, session_id: str, default=None):
+        """Returns the session `session_id`, or `default` if there is
+        none or if it expired (it is then removed)."""
+
+    @abstractmethod
+    def pop(self, session_id: str, default=None):
+        """Removes the session `session_id` and returns it (`default` if
+        there is none)."""
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Removes the expired sessions. Returns how many."""
+
+    def stats(self) -> dict:
+        """Returns the counters of the store."""
+        return {'live': len(self), 'expired': self.expired,
+                'evicted': self.evicted}
+
+    def _start_sweeper(self):
+        """Starts the background thread calling `sweep`, once."""
+        if self.sweep_interval <= 0 or self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop,
+                                             daemon=True)
+        self._sweeper.start()
+
+    def _sweep_loop(self):
+        """Calls `sweep` every `sweep_interval` seconds."""
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:   # swept again at the next interval
+                logging.getLogger(__name__).exception(
+                    "session sweep failed, retrying in %ss",
+                    self.sweep_interval)
+
+
+class ExpiringSessionStore(SessionStore):
+    """Sessions kept in the memory of the process. Expiration times are
+    kept in a heap, the least recently used sessions are evicted first.
+    """
+    def __init__(self, duration: int = 0, max_size: int = 0,
+                 sweep_interval: float = 60):
+        """Initialize an empty store."""
+        super().__init__(duration, max_size, sweep_interval)
+        self._sessions = OrderedDict()  # least recently used first
+        self._expiries = {}     # `{<session id>: <time.monotonic() expiry>}`
+        # `(<expiry>, <session id>)`, including entries of sessions since
+        # removed or stored again (they don't match `_expiries`)
+        self._heap = []
+
+    def __len__(self) -> int:
+        """Number of sessions stored, including expired sessions not
+        removed yet."""
+        return len(self._sessions)
+
+    def __setitem__(self, session_id: str, session):
+        """Stores `session`, replacing any session with the same id."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._sessions[session_id] = session
+            if self.duration > 0:
+                expiry = time.monotonic() + self.duration
+                self._expiries[session_id] = expiry
+                heapq.heappush(self._heap, (expiry, session_id))
+                if len(self._heap) > 2 * len(self._expiries) + 64:
+                    self._heap = [(e, s_id)
+                                  for s_id, e in self._expiries.items()]
+                    heapq.heapify(self._heap)
+            while 0 < self.max_size < len(self._sessions):
+                self._remove(next(iter(self._sessions)))
+                self.evicted += 1
+        if self.duration > 0:
+            self._start_sweeper()
+
+    def get(self, session_id: str, default=None):
+        """Returns the session `session_id`, or `default` if there is
+        none or if it expired (it is then removed)."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return default
+            expiry = self._expiries.get(session_id)
+            if expiry is not None and expiry < time.monotonic():
+                self._remove(session_id)
+                self.expired += 1
+                return default
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def pop(self, session_id: str, default=None):
+        """Removes the session `session_id` and returns it (`default` if
+        there is none)."""
+        with self._lock:
+            if session_id not in self._sessions:
+                return default
+            return self._remove(session_id)
+
+    def sweep(self) -> int:
+        """Removes the expired sessions. Returns how many."""
+        count = 0
+        now = time.monotonic()
+        with self._lock:
+            while self._heap and self._heap[0][0] < now:
+                expiry, session_id = heapq.heappop(self._heap)
+                if self._expiries.get(session_id) == expiry:
+                    self._remove(session_id)
+                    count += 1
+            self.expired += count
+        return count
+
+    def _remove(self, session_id: str):
+        """Removes the session `session_id` (the lock is held) and
+        returns it."""
+        self._expiries.pop(session_id, None)
+        return self._sessions.pop(session_id)
+
+
+def _encode_session(session) -> str:
+    """Returns the JSON of `session` (`datetime` values are tagged)."""
+    def default(value):
+        if type(value) is datetime:
+            return {'__datetime__': value.isoformat()}
+        raise TypeError(type(value).__name__)
+    return json.dumps(session, default=default)
+
+
+def _decode_session(session_json: str):
+    """Returns the session encoded by `_encode_session`."""
+    def object_hook(obj: dict):
+        if len(obj) == 1 and '__datetime__' in obj:
+            return datetime.fromisoformat(obj['__datetime__'])
+        return obj
+    return json.loads(session_json, object_hook=object_hook)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions kept in a SQLite database (WAL mode), shared by all the
+    processes using the same file. Sessions are JSON encoded.
+    Beyond `max_size`, the oldest sessions are evicted by `sweep`.
+    """
+    def __init__(self, db_path: str, duration: int = 0, max_size: int = 0,
+                 sweep_interval: float = 60):
+        """Initialize the store of the database file `db_path`."""
+        super().__init__(duration, max_size, sweep_interval)
+        self.db_path = db_path
+        self._local = threading.local()     # one connection per thread
+        self._conn.execute('CREATE TABLE IF NOT EXISTS sessions '
+                           '(session_id TEXT PRIMARY KEY, session TEXT, '
+                           'created_at REAL, expires_at REAL)')
+        for column in ('created_at', 'expires_at'):
+            self._conn.execute('CREATE INDEX IF NOT EXISTS sessions_{0} '
+                               'ON sessions ({0})'.format(column))
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """Connection of the current thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def __len__(self) -> int:
+        """Number of live sessions."""
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM sessions WHERE expires_at IS NULL OR '
+            'expires_at >= ?', (time.time(),)).fetchone()[0]
+
+    def __setitem__(self, session_id: str, session):
+        """Stores `session`, replacing any session with the same id."""
+        now = time.time()
+        expires_at = now + self.duration if self.duration > 0 else None
+        self._conn.execute(
+            'INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)',
+            (session_id, _encode_session(session), now, expires_at))
+        if self.duration > 0 or self.max_size > 0:
+            self._start_sweeper()
+
+    def items_since(self, since: float) -> list:
+        """Returns the `(<session id>, <session>)` of the live sessions
+        stored at or after the Unix time `since`."""
+        return [(row[0], _decode_session(row[1])) for row in
+                self._conn.execute(
+                    'SELECT session_id, session FROM sessions WHERE '
+                    'created_at >= ? AND (expires_at IS NULL OR '
+                    'expires_at >= ?)', (since, time.time()))]
+
+    def get(self, session_id: str, default=None):
+        """Returns the session `session_id`, or `default` if there is
+        none or if it expired (it is then removed)."""
+        row = self._conn.execute(
+            'SELECT session, expires_at FROM sessions WHERE session_id = ?',
+            (session_id,)).fetchone()
+        if row is None:
+            return default
+        if row[1] is not None and row[1] < time.time():
+            cursor = self._conn.execute(
+                'DELETE FROM sessions WHERE session_id = ? AND '
+                'expires_at = ?', (session_id, row[1]))
+            self.expired += cursor.rowcount
+            return default
+        return _decode_session(row[0])
+
+    def pop(self, session_id: str, default=None):
+        """Removes the session `session_id` and returns it (`default` if
+        there is none)."""
+        conn = self._conn
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT session FROM sessions WHERE session_id = ?',
+                (session_id,)).fetchone()
+            if row is None:
+                return default
+            conn.execute('DELETE FROM sessions WHERE session_id = ?',
+                         (session_id,))
+        return _decode_session(row[0])
+
+    def sweep(self) -> int:
+        """Removes the expired sessions, then the oldest ones beyond
+        `max_size`. Returns how many expired."""
+        conn = self._conn
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            count = conn.execute('DELETE FROM sessions WHERE expires_at < ?',
+                                 (time.time(),)).rowcount
+            if self.max_size > 0:
+                self.evicted += conn.execute(
+                    'DELETE FROM sessions WHERE session_id IN (SELECT '
+                    'session_id FROM sessions ORDER BY created_at LIMIT '
+                    'MAX(0, (SELECT COUNT(*) FROM sessions) - ?))',
+                    (self.max_size,)).rowcount
+        self.expired += count
+        return count
+
+
+def new_session_store(duration: int = 0, max_size: int = 0,
+                      sweep_interval: float = 60) -> SessionStore:
+    """Returns the session store selected by `SESSION_STORE`: `memory`
+    (default) or `sqlite` (file `SESSION_STORE_PATH`)."""
+    if getenv('SESSION_STORE') == 'sqlite':
+        return SQLiteSessionStore(
+            getenv('SESSION_STORE_PATH', '.db_sessions.sqlite3'),
+            duration, max_size, sweep_interval)
+    return ExpiringSessionStore(duration, max_size, sweep_interval)
@@ -14,15 +14,41 @@ def status() -> str:
     return jsonify({"status": "OK"})
 
 
+@app_views.route('/metrics', methods=['GET'], strict_slashes=False)
+def metrics() -> str:
+    """ GET /api/v1/metrics
+    Return:
+      - the latency histograms of the authentication stages, in the
+        Prometheus text format (empty unless `AUTH_METRICS=1`)
+    """
+    from api.v1.auth import metrics
+    return metrics.render(), 200, {
+        'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
 @app_views.route('/stats/', strict_slashes=False)
 def stats() -> str:
     """ GET /api/v1/stats
     Return:
       - the number of each objects
+      - the statistics of each model class (see `Base.stats`)
+      - the counters of the in-memory session store, if any
+      - the result of the last purge of expired UserSession, if any
     """
     from models.user import User
+    from models.user_session import UserSession
+    UserSession.load_from_file()
     stats = {}
     stats['users'] = User.count()
+    for cls in (User, UserSession):
+        stats[cls.__name__] = cls.stats()
+    from api.v1.app import auth
+    store = getattr(auth, 'user_id_by_session_id', None)
+    # sessions of this process (`SessionDBAuth` has no store)
+    if hasattr(store, 'stats'):
+        stats['sessions'] = store.stats()
+    if getattr(auth, 'last_purge', None) is not None:
+        stats['last_session_purge'] = auth.last_purge
     return jsonify(stats)
 
 
@@ -2,18 +2,104 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from flask import Response, abort, jsonify, request, stream_with_context
 from models.user import User
+from typing import Iterator, Union
+import json
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: maximum number of users in the page
+      - after: `next` cursor of the previous page
+      - stream: `1` to send the users one by one as they are serialized
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented (ordered by creation)
+      - with `limit` or `after`: page of User objects JSON represented
+        and cursor of the next page (`null` for the last page)
+      - 400 if `limit` or `after` is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            return jsonify({'error': "Wrong limit"}), 400
+    if after is not None:
+        after = _decode_cursor(after)
+        if after is None:
+            return jsonify({'error': "Wrong cursor"}), 400
+
+    if request.args.get('stream') == '1':
+        return Response(stream_with_context(_stream_users(limit, after)),
+                        mimetype='application/json')
+    if limit is None and after is None:
+        return jsonify([user.to_json() for user in _iter_users()])
+
+    users = User.query(order_by='created_at', after=after,
+                       limit=None if limit is None else limit + 1)
+    next_cursor = None
+    if limit is not None and len(users) > limit:
+        users = users[:limit]
+        next_cursor = _encode_cursor(users[-1])
+    return jsonify({'users': [user.to_json() for user in users],
+                    'next': next_cursor})
+
+
+def _iter_users(limit: int = None, after: tuple = None,
+                page_size: int = 1000) -> Iterator[User]:
+    """ Yields the users ordered by creation, after the `(<created_at>,
+    <id>)` cursor `after`, reading `page_size` of them at a time
+    """
+    while limit is None or limit > 0:
+        size = page_size if limit is None else min(page_size, limit)
+        users = User.query(order_by='created_at', after=after, limit=size)
+        yield from users
+        if len(users) < size:
+            return
+        after = (users[-1].created_at, users[-1].id)
+        if limit is not None:
+            limit -= len(users)
+
+
+def _stream_users(limit: int = None, after: tuple = None) -> Iterator[str]:
+    """ Yields the JSON list of the users, one user at a time
+    """
+    yield '['
+    separator = ''
+    for user in _iter_users(limit, after):
+        yield separator + json.dumps(user.to_json())
+        separator = ','
+    yield ']\n'
+
+
+def _encode_cursor(user: User) -> str:
+    """ Returns the cursor of the users created after `user`
+    """
+    cursor = "{}|{}".format(user.created_at.isoformat(), user.id)
+    return urlsafe_b64encode(cursor.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Union[tuple, None]:
+    """ Returns the `(<created_at>, <id>)` of `cursor`, `None` if invalid
+    (timestamps with an offset can't be compared with the stored ones)
+    """
+    try:
+        created_at, user_id = urlsafe_b64decode(
+            cursor.encode()).decode().split('|', 1)
+        created_at = datetime.fromisoformat(created_at)
+    except ValueError:
+        return None
+    if created_at.tzinfo is not None:
+        return None
+    return (created_at, user_id)
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -92,6 +178,47 @@ def create_user() -> str:
     return jsonify({'error': error_msg}), 400
 
 
+@app_views.route('/users/batch', methods=['POST'], strict_slashes=False)
+def create_users() -> str:
+    """ POST /api/v1/users/batch
+    JSON body:
+      - list of users, each with the attributes of POST /api/v1/users/
+    Return:
+      - list of the User objects JSON represented, written to file at once
+      - 400 if one of the users can't be created (none is created)
+    """
+    rj = None
+    try:
+        rj = request.get_json()
+    except Exception:
+        rj = None
+    if type(rj) is not list:
+        return jsonify({'error': "Wrong format"}), 400
+    for i, user_json in enumerate(rj):
+        error_msg = None
+        if type(user_json) is not dict:
+            error_msg = "Wrong format"
+        elif user_json.get("email", "") == "":
+            error_msg = "email missing"
+        elif user_json.get("password", "") == "":
+            error_msg = "password missing"
+        if error_msg is not None:
+            return jsonify({'error': error_msg, 'index': i}), 400
+    try:
+        users = []
+        for user_json in rj:
+            user = User()
+            user.email = user_json.get("email")
+            user.password = user_json.get("password")
+            user.first_name = user_json.get("first_name")
+            user.last_name = user_json.get("last_name")
+            users.append(user)
+        User.save_many(users)
+        return jsonify([user.to_json() for user in users]), 201
+    except Exception as e:
+        return jsonify({'error': "Can't create Users: {}".format(e)}), 400
+
+
 @app_views.route('/users/<user_id>', methods=['PUT'], strict_slashes=False)
 def update_user(user_id: str = None) -> str:
     """ PUT /api/v1/users/:id
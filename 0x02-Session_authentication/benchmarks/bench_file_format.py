@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+""" Benchmark of `save_to_file`/`load_from_file` time and file size with
+the `json` and `binary` snapshot formats
+
+Usage: ./benchmarks/bench_file_format.py [number of users ...]
+(runs in a temporary directory, default sizes: 10000 100000 1000000)
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import models.base as base  # noqa: E402
+from models.user import User  # noqa: E402
+
+# run in a new process: a load starts with nothing in memory, as at startup
+LOAD = """
+import time
+from models.user import User
+start = time.perf_counter()
+User.load_from_file()
+elapsed = time.perf_counter() - start
+assert User.count() == {count}
+print(elapsed)
+"""
+
+
+def bench(count: int):
+    """ Prints save/load times and file sizes for `count` users
+    """
+    base.DATA['User'] = {}
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First{}".format(i), last_name="Last")
+        user.password = "pwd{}".format(i)
+        base.DATA['User'][user.id] = user
+    for file_format in ('json', 'binary'):
+        User.FILE_FORMAT = file_format
+        start = time.perf_counter()
+        User.save_to_file()
+        save_time = time.perf_counter() - start
+        size = os.path.getsize(User.snapshot_path())
+
+        env = dict(os.environ, DB_FILE_FORMAT=file_format, PYTHONPATH=ROOT)
+        load_time = float(subprocess.run(
+            [sys.executable, '-c', LOAD.format(count=count)], env=env,
+            check=True, capture_output=True, text=True).stdout)
+        os.remove(User.snapshot_path())
+        print("{:>9} users {:>6}: save {:7.3f}s  load {:7.3f}s  "
+              "size {:8.1f} MiB".format(count, file_format, save_time,
+                                        load_time, size / (1 << 20)))
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        for count in sizes:
+            bench(count)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+""" Benchmark of `load_from_file` time with the `strptime` timestamp
+parsing, the `fromisoformat` fast path and lazy timestamps
+(`DB_LAZY_TIMESTAMPS=1`). "init" is the time spent building the objects
+from the file records, the part timestamp parsing affects.
+
+Usage: ./benchmarks/bench_load.py [number of users ...]
+(runs in a temporary directory, default sizes: 100000 1000000)
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models.base as base  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+MODES = (
+    ('strptime', {'_ISO_TIMESTAMPS': False, 'LAZY_TIMESTAMPS': False}),
+    ('fromisoformat', {'_ISO_TIMESTAMPS': True, 'LAZY_TIMESTAMPS': False}),
+    ('lazy', {'_ISO_TIMESTAMPS': True, 'LAZY_TIMESTAMPS': True}),
+)
+
+
+def bench(count: int):
+    """ Prints the load time of `count` users with each parsing mode
+    """
+    base.DATA['User'] = {}
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First{}".format(i), last_name="Last")
+        user.password = "pwd{}".format(i)
+        base.DATA['User'][user.id] = user
+    User.save_to_file()
+    with open(User.snapshot_path()) as f:
+        records = list(json.load(f).values())
+    for name, settings in MODES:
+        for attr, value in settings.items():
+            setattr(base, attr, value)
+        start = time.perf_counter()
+        for obj_json in records:
+            User(**obj_json)
+        init_time = time.perf_counter() - start
+
+        base.DATA['User'] = {}
+        base._FILE_STATES.pop('User', None)     # force a full load
+        for indexes in (base._INDEXES, base._SORTED_INDEXES,
+                        base._INDEXED_VALUES):
+            indexes.pop('User', None)
+        start = time.perf_counter()
+        User.load_from_file()
+        load_time = time.perf_counter() - start
+        assert User.count() == count
+        print("{:>9} users {:>13}: init {:7.3f}s  load {:7.3f}s".format(
+            count, name, init_time, load_time))
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000, 1000000]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        for count in sizes:
+            bench(count)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+""" Benchmark of the memory used by each model object once loaded by
+`load_from_file` (the object and its entries in the indexes and the
+statistics), with the default and the compact (`DB_COMPACT_MODELS=1`)
+layouts
+
+Usage: ./benchmarks/bench_memory.py [number of objects]
+(runs in a temporary directory)
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def measure(count: int):
+    """ Prints the bytes used per `User` and `UserSession` object after
+    `load_from_file` of a file of `count` objects
+    """
+    import gc
+    import tracemalloc
+    import uuid
+    import models.base as base
+    from models.user import User
+    from models.user_session import UserSession
+
+    users = [User(email="user{}@example.com".format(i), password=None)
+             for i in range(count)]
+    sessions = [UserSession(user_id=user.id, session_id=str(uuid.uuid4()))
+                for user in users]
+    for cls, objs in ((User, users), (UserSession, sessions)):
+        s_class = cls.__name__
+        base.DATA[s_class] = {obj.id: obj for obj in objs}
+        cls.save_to_file()
+        # forget everything about the class, as in a new process
+        del objs[:]
+        base.DATA[s_class] = {}
+        for state in (base._FILE_STATES, base._INDEXES,
+                      base._SORTED_INDEXES, base._INDEXED_VALUES,
+                      base._HISTOGRAMS, base._SHARD_IDS):
+            state.pop(s_class, None)
+        gc.collect()
+        tracemalloc.start()
+        cls.load_from_file()
+        cls.query({'created_at__gte': '2000-01-01T00:00:00'}, limit=1)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("{:12} {:8.1f} bytes/object".format(s_class, size / count))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    if os.getenv('BENCH_CHILD') == '1':
+        measure(count)
+        sys.exit(0)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for layout, compact in (('default', '0'), ('compact', '1')):
+            print("{} layout ({} objects):".format(layout, count))
+            env = dict(os.environ, BENCH_CHILD='1', DB_COMPACT_MODELS=compact,
+                       PYTHONPATH=root)
+            subprocess.run([sys.executable, os.path.abspath(__file__),
+                            str(count)], env=env, cwd=tmp_dir, check=True)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+""" Benchmark suite of `models.base` at realistic data sizes
+
+For each size, synthetic `User` and `UserSession` objects (one session
+per user) are saved with `save_many` in a temporary directory (or in the
+database with `DB_STORAGE=sqlite`), then each operation is timed and its
+peak memory measured with `tracemalloc`:
+  - save_to_file, load_from_file (full load, in a new process)
+  - get, search on an indexed attribute (per call, over 1000 calls)
+  - search on a non indexed attribute, all
+  - to_json of every object, cold (first call) and cached
+
+Results are printed and written as JSON (with the git commit and the
+`DB_*` settings) so runs of two commits can be compared.
+
+Usage: ./benchmarks/bench_models.py [options] [number of users ...]
+  -o FILE       write the results to FILE (default: bench_models.json)
+  -c FILE       compare with the results of a previous run
+  --no-memory   skip the tracemalloc pass (faster with 1000000 objects)
+(runs in a temporary directory, default sizes: 1000 10000 100000)
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import models.base as base  # noqa: E402
+from models.user import User  # noqa: E402
+from models.user_session import UserSession  # noqa: E402
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CALLS = 1000    # calls timed by the per call operations
+# run in a new process: a load starts with nothing in memory, as at startup
+LOAD = """
+import json
+import time
+import tracemalloc
+from models.{module} import {cls}
+if {trace}:
+    tracemalloc.start()
+start = time.perf_counter()
+{cls}.load_from_file()
+seconds = time.perf_counter() - start
+assert {cls}.count() == {count}
+print(json.dumps(tracemalloc.get_traced_memory()[1] if {trace} else seconds))
+"""
+
+
+def generate(count: int, seed: int = 0):
+    """ Save `count` users and as many sessions, replacing any saved
+    before
+    """
+    rand = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    users = []
+    for i in range(count):
+        created_at = start + timedelta(seconds=rand.randrange(365 * 86400))
+        user = User(email="user{}@example.com".format(i),
+                    first_name=rand.choice(("Bob", "Alice", "Eve", None)),
+                    last_name="Last{}".format(i % 1000),
+                    created_at=created_at.strftime(base.TIMESTAMP_FORMAT))
+        user.password = "pwd{}".format(i)
+        users.append(user)
+    sessions = [UserSession(user_id=user.id, session_id="{:032x}".format(
+        rand.getrandbits(128))) for user in users]
+    for cls, objs in ((User, users), (UserSession, sessions)):
+        cls.load_from_file()
+        cls.remove_many([obj.id for obj in cls.all()])
+        cls.save_many(objs)
+    base.flush()    # written now with `DB_FLUSH_INTERVAL`
+
+
+def operations(cls, count: int) -> list:
+    """ Returns the `(<name>, <setup>, <function>, <calls>)` operations
+    benchmarked for `cls`
+    """
+    attr = 'email' if cls is User else 'session_id'
+    rand = random.Random(1)
+    sample = [rand.choice(cls.all()) for _ in range(CALLS)]
+    values = [getattr(obj, attr) for obj in sample]
+    sample = [obj.id for obj in sample]
+    # an attribute without hash index: `search` scans all the objects
+    scan = {'first_name': "Bob"} if cls is User else \
+        {'created_at': cls.get(sample[0]).created_at}
+    # setting an attribute drops the cached JSON of the object
+    public = 'last_name' if cls is User else 'user_id'
+
+    def clear_json_cache():
+        for obj in cls.all():
+            setattr(obj, public, getattr(obj, public))
+
+    def to_json():
+        for obj in cls.all():
+            obj.to_json()
+
+    return [
+        ('save_to_file', None, cls.save_to_file, 1),
+        ('get', None, lambda: [cls.get(obj_id) for obj_id in sample], CALLS),
+        ('search_indexed', None,
+         lambda: [cls.search({attr: value}) for value in values], CALLS),
+        ('search_scan', None, lambda: cls.search(scan), 1),
+        ('all', None, cls.all, 1),
+        ('to_json_cold', clear_json_cache, to_json, 1),
+        ('to_json_cached', None, to_json, 1),
+    ]
+
+
+def measure(setup, function, memory: bool) -> tuple:
+    """ Returns the time (seconds) and the peak memory (bytes, or `None`)
+    of one call of `function`, run after `setup`
+    """
+    if setup is not None:
+        setup()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def measure_load(cls, count: int, memory: bool) -> tuple:
+    """ Returns the time (seconds) and the peak memory (bytes, or `None`)
+    of `load_from_file` of the `count` objects of `cls`, each measured in
+    a new process
+    """
+    results = []
+    for trace in (False, True) if memory else (False,):
+        code = LOAD.format(module=cls.__module__.split('.')[-1],
+                           cls=cls.__name__, count=count, trace=trace)
+        results.append(json.loads(subprocess.run(
+            [sys.executable, '-c', code], check=True, capture_output=True,
+            text=True, env=dict(os.environ, PYTHONPATH=ROOT)).stdout))
+    return results[0], results[1] if memory else None
+
+
+def bench(count: int, memory: bool) -> list:
+    """ Returns the results of the operations with `count` users
+    """
+    results = []
+    generate(count)
+    for cls in (User, UserSession):
+        measured = [('load_from_file', 1,
+                     measure_load(cls, count, memory))]
+        measured.extend((name, calls, measure(setup, function, memory))
+                        for name, setup, function, calls
+                        in operations(cls, count))
+        for name, calls, (seconds, peak) in measured:
+            results.append({'class': cls.__name__, 'size': count,
+                            'operation': name, 'seconds': seconds / calls,
+                            'calls': calls, 'peak_bytes': peak})
+            print("{:>8} {:>11} {:>15}: {:12.6f}s{}".format(
+                count, cls.__name__, name, seconds / calls,
+                "" if peak is None else "  peak {:8.1f} MiB".format(
+                    peak / (1 << 20))))
+    return results
+
+
+def git_commit() -> str:
+    """ Returns the commit of the working tree, or `None`
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list, previous_path: str):
+    """ Prints the time of each result relative to the same operation in
+    the results file `previous_path`
+    """
+    with open(previous_path) as f:
+        previous = {(r['class'], r['size'], r['operation']): r['seconds']
+                    for r in json.load(f)['results']}
+    print("compared with {}:".format(previous_path))
+    for r in results:
+        before = previous.get((r['class'], r['size'], r['operation']))
+        if not before:
+            continue
+        print("{:>8} {:>11} {:>15}: {:6.2f}x".format(
+            r['size'], r['class'], r['operation'], r['seconds'] / before))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('sizes', nargs='*', type=int,
+                        default=[1000, 10000, 100000])
+    parser.add_argument('-o', '--output', default='bench_models.json')
+    parser.add_argument('-c', '--compare')
+    parser.add_argument('--no-memory', action='store_true')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        for count in args.sizes:
+            results.extend(bench(count, not args.no_memory))
+    meta = {
+        'commit': git_commit(),
+        'date': datetime.utcnow().strftime(base.TIMESTAMP_FORMAT),
+        'python': platform.python_version(),
+        'settings': {k: v for k, v in os.environ.items()
+                     if k.startswith('DB_')},
+    }
+    with open(output, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2)
+    print("results written to {}".format(output))
+    if args.compare:
+        compare(results, args.compare)
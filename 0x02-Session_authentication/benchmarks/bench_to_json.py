@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+""" Microbenchmark of `Base.to_json` against the implementation walking
+`__dict__` on every call
+
+Usage: ./benchmarks/bench_to_json.py [number of users]
+"""
+from datetime import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.base import TIMESTAMP_FORMAT  # noqa: E402
+from models.user import User  # noqa: E402
+
+
+def to_json_walk(obj, for_serialization: bool = False) -> dict:
+    """ `Base.to_json` before the per-class serializer (the timestamps,
+    now stored as `_created_at` and `_updated_at`, under their keys)
+    """
+    result = {}
+    for key, value in obj.__dict__.items():
+        if key in ('_created_at', '_updated_at'):
+            key = key[1:]
+        elif key == '_json_cache' or \
+                (not for_serialization and key[0] == '_'):
+            continue
+        if type(value) is datetime:
+            result[key] = value.strftime(TIMESTAMP_FORMAT)
+        else:
+            result[key] = value
+    return result
+
+
+def timed(label: str, function, users: list, setup=None):
+    """ Prints the time per object of the best of 3 passes (`setup` is
+    called on each object before each pass, outside of the timing)
+    """
+    best = None
+    for _ in range(3):
+        if setup is not None:
+            for user in users:
+                setup(user)
+        start = time.perf_counter()
+        for user in users:
+            function(user)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("{:36} {:6.2f} us/object".format(label, best / len(users) * 1e6))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    users = [User(email="user{}@example.com".format(i), first_name="F")
+             for i in range(count)]
+    if hasattr(users[0], '__dict__'):
+        timed("__dict__ walk", to_json_walk, users)
+    timed("serializer (cold cache)", lambda user: user.to_json(), users,
+          setup=lambda user: setattr(user, 'last_name', None))
+    timed("serializer (cached)", lambda user: user.to_json(), users)
+    timed("serializer (serialization, not cached)",
+          lambda user: user.to_json(True), users)
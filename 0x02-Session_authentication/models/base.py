@@ -1,37 +1,499 @@
 #!/usr/bin/env python3
 """ Base module
 """
-from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from operator import attrgetter
+from typing import Callable, TypeVar, List, Iterable, Tuple
+from os import getenv, path
+import atexit
 import json
+import logging
+import os
+import sys
+import threading
+import time
 import uuid
+import zlib
+from models import binary_format
+from models.query import SortedIndex, matches, parse_conditions
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+# with the default format timestamps are ISO 8601 strings: they can be
+# parsed with `fromisoformat` and compared as strings
+_ISO_TIMESTAMPS = TIMESTAMP_FORMAT == "%Y-%m-%dT%H:%M:%S"
+_TIMESTAMP_FIELDS = ('created_at', 'updated_at')
+# loaded timestamp strings are only parsed when first read
+LAZY_TIMESTAMPS = getenv('DB_LAZY_TIMESTAMPS') == '1' and _ISO_TIMESTAMPS
+
+# format of `.db_<Class>.json` snapshots, unless set by the class:
+# `json`, or `binary` (`.db_<Class>.bin`, see `models.binary_format`)
+DEFAULT_FILE_FORMAT = getenv('DB_FILE_FORMAT', 'json')
+
+# storage backend: `None` keeps objects in `DATA` and `.db_<Class>.json`
+STORAGE = None
+if getenv('DB_STORAGE') == 'sqlite':
+    from models.sqlite_storage import SQLiteStorage
+    STORAGE = SQLiteStorage(getenv('DB_SQLITE_PATH', '.db.sqlite3'))
+
+# compact objects: no `__dict__` (`__slots__` only), timestamps stored
+# as seconds since the epoch and converted to `datetime` when accessed
+COMPACT_MODELS = getenv('DB_COMPACT_MODELS') == '1'
+_EPOCH = datetime(1970, 1, 1)
+
+# append-only journal: each save/remove appends one record to
+# `.db_<Class>.journal` instead of rewriting `.db_<Class>.json`
+JOURNAL_MODE = getenv('DB_JOURNAL') == '1'
+try:    # journal size (bytes) that triggers a background compaction
+    JOURNAL_COMPACT_SIZE = int(getenv('DB_JOURNAL_COMPACT_SIZE'))
+except (TypeError, ValueError):
+    JOURNAL_COMPACT_SIZE = 1 << 20
+_JOURNAL_LOCK = threading.Lock()
+_COMPACTING = set()     # names of classes being compacted
+_SNAPSHOT_GEN = {}      # number of full snapshots written per class
+
+# sharded snapshots: with `DB_SHARDS` > 1 the objects of a class are
+# spread by hash of their id over `.db_<Class>.<k>.json` files, and
+# `save`/`remove` only rewrite the files of the objects changed
+try:
+    DEFAULT_SHARDS = max(1, int(getenv('DB_SHARDS')))
+except (TypeError, ValueError):
+    DEFAULT_SHARDS = 1
+# `lazy` loads a shard when its objects are first read instead of in
+# `load_from_file` (not in journal mode), `parallel` loads them all
+# there, reading several files at once
+LAZY_SHARDS = getenv('DB_SHARD_LOAD') == 'lazy' and not JOURNAL_MODE
+_LOAD_THREADS = 8
+_SHARD_IDS = {}     # `{<Class>: [{<id>: None} of each shard]}`
+
+# write-behind: `save`/`remove` only update `DATA`, a background thread
+# writes the changes every `DB_FLUSH_INTERVAL` seconds (or as soon as
+# `DB_FLUSH_THRESHOLD` changes are pending)
+try:
+    FLUSH_INTERVAL = float(getenv('DB_FLUSH_INTERVAL'))
+except (TypeError, ValueError):
+    FLUSH_INTERVAL = 0
+try:
+    FLUSH_THRESHOLD = int(getenv('DB_FLUSH_THRESHOLD'))
+except (TypeError, ValueError):
+    FLUSH_THRESHOLD = 1000
+# `always` syncs every written file to disk, `never` leaves it to the OS
+FSYNC = getenv('DB_FSYNC', 'never') == 'always'
+_SERIALIZERS = {}   # `{<class>: <function returning its JSON dictionaries>}`
+_BINARY_LOADERS = {}    # `{<class>: <function building it from a record>}`
+_PENDING = {}   # `{<class>: {<id>: <object saved, None if removed>}}`
+_PENDING_COUNT = 0
+_FLUSH_COND = threading.Condition()
+_FLUSH_LOCK = threading.Lock()  # keeps flushed changes in order
+_FLUSHER = None
+
+# writers of a class (and readers of its files) hold `_class_lock(<Class>)`;
+# readers of `DATA` work on copies taken atomically (under the GIL)
+_LOCKS = {}
+
+# secondary hash indexes: `{<Class>: {<attribute>: {<value>: <ids>}}}`,
+# `<ids>` being the id of the only object with that value (most values are
+# unique, e.g. emails) or `{<id>: None}` (see `_bucket_ids`)
+_INDEXES = {}
+# sorted indexes: `{<Class>: {<attribute>: <SortedIndex>}}`
+_SORTED_INDEXES = {}
+# `{<Class>: {<id>: <indexed values>}}` of the objects changed since they
+# were indexed (see `_keep_indexed_values`), the others are indexed with
+# their current values
+_INDEXED_VALUES = {}
+# `{<class>: (<attributes of the indexed values>, <positions of the
+# timestamps among them>, <attributes they are stored in>, <getter of the
+# stored values>)}`, see `_index_layout`
+_INDEX_LAYOUTS = {}
+# statistics kept up to date with the indexes: number of objects per day
+# `{<Class>: {'created_at': {<YYYY-MM-DD>: <count>}, 'updated_at': {...}}}`
+_HISTOGRAMS = {}
+
+# files seen by the last `load_from_file` of each class:
+# `{<Class>: {'snapshots': [<file key of each shard>], 'unloaded': {<shard
+# changed since its objects were loaded>}, 'journals': {<inode>: <offset
+# read>}}}`
+_FILE_STATES = {}
+
+
+def _file_key(file_path: str) -> tuple:
+    """ Returns what identifies the current content of `file_path`
+    (`None` if there is no such file)
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _class_lock(s_class: str) -> threading.RLock:
+    """ Returns the lock of the class named `s_class`
+    """
+    lock = _LOCKS.get(s_class)
+    if lock is None:
+        lock = _LOCKS.setdefault(s_class, threading.RLock())
+    return lock
+
+
+def _to_datetime(value) -> datetime:
+    """ Returns the `datetime` of a timestamp string, of seconds since
+    the epoch or of a `datetime`
+    """
+    if type(value) is str:
+        if _ISO_TIMESTAMPS and len(value) == 19 and value[10] == 'T':
+            return datetime.fromisoformat(value)    # much faster
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+    if type(value) is datetime:
+        return value
+    return _EPOCH + timedelta(seconds=value)
+
+
+def _store_timestamp(value):
+    """ Returns how the timestamp `value` (see `_to_datetime`) is kept in
+    an object: seconds since the epoch for compact objects, a `datetime`
+    otherwise, or the string itself until it's read with lazy timestamps
+    """
+    if LAZY_TIMESTAMPS and type(value) is str:
+        return value
+    if COMPACT_MODELS:
+        if type(value) in (int, float):
+            return value
+        return (_to_datetime(value) - _EPOCH).total_seconds()
+    return _to_datetime(value)
+
+
+def _json_timestamp(value) -> str:
+    """ Returns the timestamp string of a stored timestamp `value`
+    """
+    if type(value) is str:
+        return value
+    if type(value) is not datetime:
+        value = _EPOCH + timedelta(seconds=value)
+    if _ISO_TIMESTAMPS:     # same as `strftime`, much faster
+        if not value.microsecond:   # loaded ones, no keyword to parse
+            return value.isoformat()
+        return value.isoformat(timespec='seconds')
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def _timestamp_key(value):
+    """ Returns the key of a timestamp (a stored timestamp or `datetime`)
+    in indexes, ordered like the timestamps: the stored timestamp itself
+    (nothing is allocated per object), or with lazy timestamps its ISO
+    8601 string (loaded strings aren't parsed)
+    """
+    if value is None:
+        return None
+    if not LAZY_TIMESTAMPS:
+        return _store_timestamp(value)
+    if type(value) is str:
+        return value
+    if type(value) is not datetime:
+        value = _EPOCH + timedelta(seconds=value)
+    return value.isoformat()
+
+
+def _bucket_ids(bucket) -> Iterable[str]:
+    """ Returns the ids of a bucket of a hash index
+    """
+    if bucket is None:
+        return ()
+    if type(bucket) is dict:
+        return bucket
+    return (bucket,)
+
+
+def _day(key) -> str:
+    """ Returns the `YYYY-MM-DD` day of a timestamp key (see
+    `_timestamp_key`)
+    """
+    if key is None or type(key) is str:
+        return key and key[:10]
+    if type(key) is not datetime:
+        key = _EPOCH + timedelta(seconds=key)
+    return key.date().isoformat()
+
+
+def _index_layout(cls) -> Tuple[tuple, tuple, tuple, Callable]:
+    """ Returns the attributes of the indexed values (`INDEXES`,
+    `SORTED_INDEXES`, then the timestamps not in them), the positions of
+    `created_at` and `updated_at` among them, the names of the attributes
+    they are stored in and the getter of their stored values, made once
+    per class
+    """
+    layout = _INDEX_LAYOUTS.get(cls)
+    if layout is None:
+        attrs = cls.INDEXES + cls.SORTED_INDEXES
+        attrs += tuple(attr for attr in _TIMESTAMP_FIELDS
+                       if attr not in attrs)
+        positions = tuple(attrs.index(attr) for attr in _TIMESTAMP_FIELDS)
+        stored = tuple('_' + attr if attr in _TIMESTAMP_FIELDS else attr
+                       for attr in attrs)
+        layout = _INDEX_LAYOUTS.setdefault(
+            cls, (attrs, positions, stored, attrgetter(*stored)))
+    return layout
+
+
+def _count_days(s_class: str, keys: tuple, delta: int):
+    """ Add `delta` to the buckets of the days of the `(<created_at key>,
+    <updated_at key>)` `keys` in the histograms of the class `s_class`
+    """
+    histograms = _HISTOGRAMS.get(s_class)
+    if histograms is None:
+        histograms = _HISTOGRAMS.setdefault(
+            s_class, {attr: {} for attr in _TIMESTAMP_FIELDS})
+    for attr, key in zip(_TIMESTAMP_FIELDS, keys):
+        day = _day(key)
+        if day is None:
+            continue
+        buckets = histograms[attr]
+        count = buckets.get(day, 0) + delta
+        if count:
+            buckets[day] = count
+        else:
+            del buckets[day]
+
+
+def _serializer(cls) -> Callable[[object, bool], dict]:
+    """ Returns the function building the public or the serialization
+    JSON dictionary of an object of `cls`, made once per class
+    """
+    cached = _SERIALIZERS.get(cls)
+    if cached is not None:
+        return cached
+    # `(<key>, <attribute>, <is a timestamp>)` of each field: timestamps
+    # are read as stored, lazy ones don't need to be parsed
+    fields = tuple((key, '_' + key, True) if key in _TIMESTAMP_FIELDS
+                   else (key, key, False) for key in cls.FIELDS)
+    public_fields = tuple(field for field in fields if field[0][0] != '_')
+    known = frozenset([attr for _, attr, _ in fields] + ['_json_cache'])
+    # `(<keys>, <attributes>, <getter>, <positions of the timestamps>)` of
+    # the public and the serialization fields
+    layouts = tuple((tuple(key for key, _, _ in f),
+                     tuple(attr for _, attr, _ in f),
+                     attrgetter(*(attr for _, attr, _ in f)),
+                     tuple(i for i, field in enumerate(f) if field[2]))
+                    for f in (public_fields, fields))
+
+    def serializer(obj, for_serialization: bool = False) -> dict:
+        """ Returns the public (serialization if `for_serialization`)
+        dictionary of `obj`
+        """
+        keys, attrs, getter, positions = layouts[for_serialization]
+        try:
+            values = getter(obj)
+        except AttributeError:  # not all set on this object
+            values = tuple(getattr(obj, attr, None) for attr in attrs)
+        result = dict(zip(keys, values))
+        for i in positions:
+            if values[i] is not None:
+                result[keys[i]] = _json_timestamp(values[i])
+        # attributes set on the object besides `FIELDS`
+        obj_dict = getattr(obj, '__dict__', known)
+        if len(obj_dict) > len(known):
+            for key, value in list(obj_dict.items()):
+                if key in known or \
+                        (not for_serialization and key[0] == '_'):
+                    continue
+                if type(value) is datetime:
+                    value = _json_timestamp(value)
+                result[key] = value
+        return result
+
+    return _SERIALIZERS.setdefault(cls, serializer)
+
+
+def _binary_loader(cls) -> Callable[[dict], object]:
+    """ Returns the function building an object of `cls` from a record of
+    a binary snapshot (see `to_binary`), made once per class: the values
+    are set as stored, without `__init__` and `__setattr__` (the
+    timestamps stay seconds since the epoch in compact objects)
+    """
+    cached = _BINARY_LOADERS.get(cls)
+    if cached is not None:
+        return cached
+    keys = cls.FIELDS
+    attrs = tuple('_' + key if key in _TIMESTAMP_FIELDS else key
+                  for key in keys)
+    positions = tuple(i for i, key in enumerate(keys)
+                      if key in _TIMESTAMP_FIELDS)
+    set_attr = object.__setattr__
+
+    def loader(record: dict):
+        """ Returns the object of `record`
+        """
+        values = [record.get(key) for key in keys]
+        for i in positions:
+            value = values[i]
+            if value is None:   # as in `__init__`
+                value = datetime.utcnow()
+            values[i] = _store_timestamp(value)
+        obj = cls.__new__(cls)
+        if COMPACT_MODELS:
+            values[0] = sys.intern(values[0])
+            for attr, value in zip(attrs, values):
+                set_attr(obj, attr, value)
+        else:
+            obj.__dict__.update(zip(attrs, values))
+        set_attr(obj, '_json_cache', None)
+        return obj
+
+    return _BINARY_LOADERS.setdefault(cls, loader)
+
+
+def _sync(f):
+    """ Flush the file object `f` to disk if `DB_FSYNC` asks for it
+    """
+    if FSYNC:
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _schedule(cls, changes: dict):
+    """ Queue the changes `{<id>: <object saved, None if removed>}` of
+    `cls` for the background flusher
+    """
+    global _PENDING_COUNT, _FLUSHER
+    with _FLUSH_COND:
+        _PENDING.setdefault(cls, {}).update(changes)
+        _PENDING_COUNT += len(changes)
+        if _FLUSHER is None:
+            _FLUSHER = threading.Thread(target=_flush_loop, daemon=True)
+            _FLUSHER.start()
+        if _PENDING_COUNT >= FLUSH_THRESHOLD:
+            _FLUSH_COND.notify()
+
+
+def _flush_loop():
+    """ Flush pending changes every `FLUSH_INTERVAL` seconds, or sooner
+    once `FLUSH_THRESHOLD` changes are pending. Changes that couldn't be
+    written are kept and written again at the next interval.
+    """
+    while True:
+        with _FLUSH_COND:
+            _FLUSH_COND.wait_for(lambda: _PENDING_COUNT >= FLUSH_THRESHOLD,
+                                 timeout=FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            logging.getLogger(__name__).exception(
+                "write-behind flush failed, retrying in %ss", FLUSH_INTERVAL)
+            time.sleep(FLUSH_INTERVAL)
+
+
+def _requeue(cls, changes: dict):
+    """ Queue again the changes of `cls` that couldn't be written,
+    unless newer changes of the same objects are already queued
+    """
+    global _PENDING_COUNT
+    with _FLUSH_COND:
+        queued = _PENDING.get(cls, {})
+        changes = {obj_id: obj for obj_id, obj in changes.items()
+                   if obj_id not in queued}
+        changes.update(queued)
+        _PENDING[cls] = changes
+        _PENDING_COUNT += len(changes) - len(queued)
+
+
+def flush():
+    """ Write all changes queued in write-behind mode to file.
+    Called at exit, and should be called before any other shutdown.
+    If a write fails, the changes not written are queued again and the
+    error is raised.
+    """
+    global _PENDING_COUNT
+    with _FLUSH_LOCK:
+        with _FLUSH_COND:
+            pending = _PENDING.copy()
+            _PENDING.clear()
+            _PENDING_COUNT = 0
+        pending = list(pending.items())
+        for i, (cls, changes) in enumerate(pending):
+            try:
+                cls._persist(changes)
+            except BaseException:
+                for failed_cls, failed_changes in pending[i:]:
+                    _requeue(failed_cls, failed_changes)
+                raise
+
+
+if FLUSH_INTERVAL > 0:
+    atexit.register(flush)
 
 
 class Base():
     """ Base class
     """
+    # attributes with a hash index used by `search` for equality
+    INDEXES = ()
+    # attributes with a sorted index used by `query` for ranges and order
+    SORTED_INDEXES = ('created_at', 'updated_at')
+    # attributes of the objects (in a compact object: the only ones)
+    FIELDS = ('id', 'created_at', 'updated_at')
+    # format of the snapshot file: `json` or `binary`
+    FILE_FORMAT = DEFAULT_FILE_FORMAT
+    # number of snapshot files the objects are spread over
+    SHARDS = DEFAULT_SHARDS
+    if COMPACT_MODELS:
+        __slots__ = ('id', '_created_at', '_updated_at', '_json_cache')
+
+    @property
+    def created_at(self) -> datetime:
+        """ Getter of the creation time
+        """
+        return self._get_timestamp('_created_at')
+
+    @created_at.setter
+    def created_at(self, value: datetime):
+        """ Setter of the creation time
+        """
+        self._created_at = _store_timestamp(value)
+
+    @property
+    def updated_at(self) -> datetime:
+        """ Getter of the last update time
+        """
+        return self._get_timestamp('_updated_at')
+
+    @updated_at.setter
+    def updated_at(self, value: datetime):
+        """ Setter of the last update time
+        """
+        self._updated_at = _store_timestamp(value)
+
+    def _get_timestamp(self, attr: str) -> datetime:
+        """ Returns the timestamp stored in `attr` as a `datetime`
+        """
+        value = getattr(self, attr)
+        if type(value) is datetime:
+            return value
+        if type(value) is str:  # lazy timestamp: parsed once
+            value = _to_datetime(value)
+            # same JSON: keep the cache (no `__setattr__`)
+            object.__setattr__(self, attr, _store_timestamp(value))
+            return value
+        return _EPOCH + timedelta(seconds=value)
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
+        object.__setattr__(self, '_json_cache', None)   # see `to_json`
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+            DATA.setdefault(s_class, {})
 
-        self.id = kwargs.get('id', str(uuid.uuid4()))
+        self.id = kwargs['id'] if 'id' in kwargs else str(uuid.uuid4())
+        if COMPACT_MODELS:  # share one string between all copies of an id
+            self.id = sys.intern(self.id)
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = kwargs.get('created_at')
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = kwargs.get('updated_at')
         else:
             self.updated_at = datetime.utcnow()
 
@@ -44,67 +506,528 @@ class Base():
             return False
         return (self.id == other.id)
 
+    def __setattr__(self, name: str, value):
+        """ Set an attribute and drop the cached JSON of the object (none
+        while it is built)
+        """
+        layout = _INDEX_LAYOUTS.get(self.__class__) or \
+            _index_layout(self.__class__)
+        if name in layout[2]:
+            self._keep_indexed_values()
+        object.__setattr__(self, name, value)
+        if self._json_cache is not None:   # after setting it, see `to_json`
+            object.__setattr__(self, '_json_cache', None)
+
     def to_json(self, for_serialization: bool = False) -> dict:
-        """ Convert the object a JSON dictionary
+        """ Convert the object a JSON dictionary.
+        Both are built by the serializer of the class. The public one is
+        kept until an attribute of the object is set, the serialization
+        one (written to files once per object) isn't kept.
+        """
+        serializer = _SERIALIZERS.get(self.__class__) or \
+            _serializer(self.__class__)
+        if for_serialization:
+            return serializer(self, True)
+        # `[<JSON dictionary>]`, a new list for each build: an attribute
+        # set meanwhile drops the list, the dictionary is never read
+        cell = getattr(self, '_json_cache', None)
+        if cell is not None and cell[0] is not None:
+            return dict(cell[0])
+        cell = [None]
+        object.__setattr__(self, '_json_cache', cell)
+        cell[0] = serializer(self)
+        return dict(cell[0])
+
+    def to_binary(self) -> dict:
+        """ Convert the object to the record of a binary snapshot:
+        values of `FIELDS`, with timestamps in seconds since the epoch
         """
         result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
-                continue
+        for key in self.FIELDS:
+            value = getattr(self, key, None)
             if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
-            else:
-                result[key] = value
+                value = (value - _EPOCH).total_seconds()
+            result[key] = value
         return result
 
+    @classmethod
+    def snapshot_path(cls, shard: int = 0) -> str:
+        """ Path of the snapshot file of the class (of its shard `shard`
+        if the class has several)
+        """
+        extension = 'bin' if cls.FILE_FORMAT == 'binary' else 'json'
+        if cls.SHARDS == 1:
+            return ".db_{}.{}".format(cls.__name__, extension)
+        return ".db_{}.{}.{}".format(cls.__name__, shard, extension)
+
+    @classmethod
+    def file_keys(cls) -> tuple:
+        """ Returns what identifies the current content of the files of
+        the class: it changes whenever one of them is written
+        """
+        if STORAGE is not None:
+            return STORAGE.file_keys()
+        journal_path = ".db_{}.journal".format(cls.__name__)
+        paths = [cls.snapshot_path(shard) for shard in range(cls.SHARDS)]
+        paths.extend((journal_path + '.old', journal_path))
+        return tuple(_file_key(file_path) for file_path in paths)
+
+    @classmethod
+    def shard_of(cls, obj_id: str) -> int:
+        """ Shard (snapshot file) of the object `obj_id`
+        """
+        if cls.SHARDS == 1:
+            return 0
+        return zlib.crc32(str(obj_id).encode()) % cls.SHARDS
+
+    @classmethod
+    def _shard_ids(cls) -> List[dict]:
+        """ Returns the `{<id>: None}` of the objects in memory of each
+        shard, kept up to date by `_index`/`_unindex`
+        """
+        s_class = cls.__name__
+        shards = _SHARD_IDS.get(s_class)
+        if shards is None or len(shards) != cls.SHARDS:
+            shards = [{} for _ in range(cls.SHARDS)]
+            for obj_id in DATA.get(s_class, {}):
+                shards[cls.shard_of(obj_id)][obj_id] = None
+            _SHARD_IDS[s_class] = shards
+        return shards
+
+    @classmethod
+    def _split(cls, objs: dict) -> List[dict]:
+        """ Returns the objects of `objs` of each shard
+        """
+        if cls.SHARDS == 1:
+            return [objs]
+        shards = [{} for _ in range(cls.SHARDS)]
+        for obj_id, obj in objs.items():
+            shards[cls.shard_of(obj_id)][obj_id] = obj
+        return shards
+
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from file, then replay the journal
+        (if any) on top of them.
+        Files that didn't change since the last load are skipped, only
+        the new records of a journal are read and only objects whose
+        content changed are rebuilt.
         """
+        if STORAGE is not None:
+            return STORAGE.load(cls)
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
+        journal_path = ".db_{}.journal".format(s_class)
+        with _class_lock(s_class):
+            if DATA.get(s_class) is None:
+                DATA.setdefault(s_class, {})
+            state = _FILE_STATES.get(s_class)
+            keys = [_file_key(cls.snapshot_path(shard))
+                    for shard in range(cls.SHARDS)]
+            if state is None or state['snapshots'] != keys:
+                old_keys = [None] * cls.SHARDS if state is None or \
+                    len(state['snapshots']) != cls.SHARDS \
+                    else state['snapshots']
+                unloaded = set() if state is None else state['unloaded']
+                unloaded.update(shard for shard in range(cls.SHARDS)
+                                if keys[shard] != old_keys[shard])
+                # journals are replayed from the start after a new snapshot
+                state = {'snapshots': keys, 'unloaded': unloaded,
+                         'journals': {}}
+                _FILE_STATES[s_class] = state
+                if not LAZY_SHARDS:
+                    cls._merge_shards(sorted(unloaded))
+
+            # a journal left over by an interrupted compaction comes first
+            for j_path in (journal_path + '.old', journal_path):
+                try:
+                    stat = os.stat(j_path)
+                except FileNotFoundError:
+                    continue
+                offset = state['journals'].get(stat.st_ino, 0)
+                if stat.st_size < offset:   # truncated: read it again
+                    offset = 0
+                if stat.st_size > offset:
+                    state['journals'][stat.st_ino] = cls.replay_journal(
+                        j_path, offset)
+
+            cls._apply_pending()
+            cls._merge_indexes()
+
+    @classmethod
+    def _merge_indexes(cls):
+        """ Sort the entries added by a load in the sorted indexes
+        """
+        for index in _SORTED_INDEXES.get(cls.__name__, {}).values():
+            index.merge()
+
+    @classmethod
+    def _apply_pending(cls):
+        """ Apply the changes not flushed yet, newer than anything in the
+        files, to the objects in memory
+        """
+        s_class = cls.__name__
+        with _FLUSH_COND:
+            changes = dict(_PENDING.get(cls, {}))
+        for obj_id, obj in changes.items():
+            cls._unindex(obj_id)
+            if obj is None:
+                DATA[s_class].pop(obj_id, None)
+            else:
+                DATA[s_class][obj_id] = obj
+                obj._index()
+
+    @classmethod
+    def _load_shards(cls, shards: Iterable[int] = None):
+        """ Load the shards of `shards` (all by default) whose file
+        changed since their objects were loaded (see `DB_SHARD_LOAD`)
+        """
+        s_class = cls.__name__
+        state = _FILE_STATES.get(s_class)
+        if state is None or not state['unloaded']:
             return
+        with _class_lock(s_class):
+            state = _FILE_STATES[s_class]
+            unloaded = state['unloaded'] if shards is None else \
+                state['unloaded'].intersection(shards)
+            if unloaded:
+                cls._merge_shards(sorted(unloaded))
+                cls._apply_pending()
+                cls._merge_indexes()
 
+    @classmethod
+    def _merge_shards(cls, shards: List[int]):
+        """ Make the objects in memory of each shard of `shards` match its
+        snapshot file, reading several files at once
+        """
+        paths = [cls.snapshot_path(shard) for shard in shards]
+        if len(paths) > 1:
+            with ThreadPoolExecutor(min(len(paths), _LOAD_THREADS)) as pool:
+                snapshots = list(pool.map(cls._read_snapshot, paths))
+        else:
+            snapshots = [cls._read_snapshot(file_path) for file_path in paths]
+        unloaded = _FILE_STATES[cls.__name__]['unloaded']
+        for shard, objs_json in zip(shards, snapshots):
+            cls._merge_snapshot(objs_json, shard)
+            unloaded.discard(shard)
+
+    @classmethod
+    def _read_snapshot(cls, file_path: str) -> dict:
+        """ Returns the `{<id>: <JSON dictionary or binary record>}` of the
+        objects in the snapshot `file_path` (empty if there is no file)
+        """
+        if not path.exists(file_path):
+            return {}
+        if cls.FILE_FORMAT == 'binary':
+            with open(file_path, 'rb') as f:
+                return {obj_json['id']: obj_json
+                        for obj_json in binary_format.load(f)}
         with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+            return json.load(f)
+
+    @classmethod
+    def _merge_snapshot(cls, objs_json: dict, shard: int = 0):
+        """ Make the objects in memory of `shard` match the objects of its
+        snapshot `objs_json`, keeping the objects whose content didn't
+        change
+        """
+        objs = DATA[cls.__name__]
+        ids = objs if cls.SHARDS == 1 else cls._shard_ids()[shard]
+        binary = cls.FILE_FORMAT == 'binary'
+        for obj_id in [obj_id for obj_id in ids if obj_id not in objs_json]:
+            cls._unindex(obj_id)
+            del objs[obj_id]
+        for obj_id, obj_json in objs_json.items():
+            cls._load_obj(obj_id, obj_json, binary)
 
     @classmethod
-    def save_to_file(cls):
-        """ Save all objects to file
+    def _load_obj(cls, obj_id: str, obj_json: dict, binary: bool = False):
+        """ Store the object `obj_id` loaded from `obj_json` (a `to_binary`
+        record if `binary`), unless the object in memory has the same content
+        """
+        objs = DATA[cls.__name__]
+        obj = objs.get(obj_id)
+        if obj is not None and \
+                (obj.to_binary() if binary else obj.to_json(True)) == obj_json:
+            return
+        cls._unindex(obj_id)
+        obj = _binary_loader(cls)(obj_json) if binary else cls(**obj_json)
+        objs[obj.id] = obj
+        obj._index()
+
+    @classmethod
+    def replay_journal(cls, journal_path: str, offset: int = 0) -> int:
+        """ Apply every record of the journal file `journal_path`, from
+        byte `offset`, to the objects in memory.
+        Returns the offset of the first record not applied yet.
+        """
+        s_class = cls.__name__
+        with open(journal_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break   # record still being written
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue    # torn record of an interrupted write
+                if record['op'] == 'remove':
+                    if record['id'] in DATA[s_class]:
+                        cls._unindex(record['id'])
+                        del DATA[s_class][record['id']]
+                else:
+                    cls._load_obj(record['id'], record['obj'])
+        return offset
+
+    @classmethod
+    def save_to_file(cls, shards: Iterable[int] = None):
+        """ Save all objects to file (only the files of `shards`, if given)
+        """
+        if STORAGE is not None:
+            return      # already stored by `save`
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        shards = range(cls.SHARDS) if shards is None else sorted(shards)
+        with _class_lock(s_class):
+            cls._load_shards(shards)
+            state = _FILE_STATES.get(s_class)
+            if state is None or len(state['snapshots']) != cls.SHARDS:
+                state = {'snapshots': [None] * cls.SHARDS, 'unloaded': set()}
+            keys = list(state['snapshots'])
+            ids = cls._shard_ids() if cls.SHARDS > 1 else [DATA[s_class]]
+            with _JOURNAL_LOCK:
+                for shard in shards:
+                    objs = {obj_id: DATA[s_class][obj_id]
+                            for obj_id in ids[shard]}
+                    tmp_path = cls._write_tmp_snapshot(objs, shard)
+                    try:
+                        keys[shard] = _file_key(tmp_path)
+                        os.replace(tmp_path, cls.snapshot_path(shard))
+                    finally:
+                        if path.exists(tmp_path):   # not replaced
+                            os.remove(tmp_path)
+                # memory already matches the new files: no need to reload
+                _FILE_STATES[s_class] = {'snapshots': keys, 'journals': {},
+                                         'unloaded': state['unloaded']}
+                # the snapshot supersedes any journal (and running compaction)
+                _SNAPSHOT_GEN[s_class] = _SNAPSHOT_GEN.get(s_class, 0) + 1
+                for j_path in (journal_path + '.old', journal_path):
+                    if path.exists(j_path):
+                        os.remove(j_path)
+
+    @classmethod
+    def convert_file(cls, file_format: str, shards: int = None):
+        """ Convert the snapshot files of the class to `file_format`
+        (`json` or `binary`), spread over `shards` files if given, and use
+        that layout from now on
+        """
+        s_class = cls.__name__
+        with _class_lock(s_class):
+            cls.load_from_file()
+            cls._load_shards()
+            old_paths = [cls.snapshot_path(shard)
+                         for shard in range(cls.SHARDS)]
+            cls.FILE_FORMAT = file_format
+            if shards is not None:
+                cls.SHARDS = shards
+            cls.save_to_file()
+            new_paths = [cls.snapshot_path(shard)
+                         for shard in range(cls.SHARDS)]
+            for old_path in old_paths:
+                if old_path not in new_paths and path.exists(old_path):
+                    os.remove(old_path)
+
+    @classmethod
+    def _write_tmp_snapshot(cls, objs: dict, shard: int = 0) -> str:
+        """ Write the objects in `objs` to a temporary snapshot file
+        of `shard` and return its path
+        """
+        file_path = cls.snapshot_path(shard)
+        tmp_path = "{}.{}.tmp".format(file_path, threading.get_ident())
+        try:
+            if cls.FILE_FORMAT == 'binary':
+                rows = (tuple(obj.to_binary().values())
+                        for obj in objs.values())
+                with open(tmp_path, 'wb') as f:
+                    binary_format.dump(cls.FIELDS, rows, f)
+                    _sync(f)
+                return tmp_path
+
+            objs_json = {}
+            for obj_id, obj in objs.items():
+                objs_json[obj_id] = obj.to_json(True)
+
+            with open(tmp_path, 'w') as f:
+                json.dump(objs_json, f)
+                _sync(f)
+        except BaseException:   # no partial file left behind
+            if path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    @classmethod
+    def append_to_journal(cls, records: List[dict]):
+        """ Append `save` (`{'op': 'save', 'id': <id>, 'obj': <JSON>}`) and
+        `remove` (`{'op': 'remove', 'id': <id>}`) records to
+        `.db_<Class>.journal` and start a background compaction once the
+        journal is too big
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        journal_path = ".db_{}.journal".format(s_class)
+        lines = ''.join(json.dumps(record) + '\n' for record in records)
+
+        # taken before `_JOURNAL_LOCK`, as in `save_to_file`
+        with _class_lock(s_class), _JOURNAL_LOCK:
+            with open(journal_path, 'a') as f:
+                f.write(lines)
+                _sync(f)
+                size = f.tell()
+            if size < JOURNAL_COMPACT_SIZE or s_class in _COMPACTING:
+                return
+            _COMPACTING.add(s_class)
+            # new records go to a fresh journal while compacting
+            cls._rotate_journal(journal_path)
+            # the snapshot must hold the records other processes appended
+            try:
+                cls.load_from_file()
+            except BaseException:
+                _COMPACTING.discard(s_class)
+                raise
+            objs = dict(DATA[s_class])
+            gen = _SNAPSHOT_GEN.get(s_class, 0)
+        threading.Thread(target=cls._compact, args=(objs, gen),
+                         daemon=True).start()
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @staticmethod
+    def _rotate_journal(journal_path: str):
+        """ Move the journal aside to `<journal>.old`, appending it to a
+        previous `.old` journal that was never folded into a snapshot
+        """
+        old_path = journal_path + '.old'
+        if not path.exists(old_path):
+            os.replace(journal_path, old_path)
+            return
+        with open(journal_path, 'r') as src, open(old_path, 'a') as dst:
+            dst.write(src.read())
+        os.remove(journal_path)
+
+    @classmethod
+    def _compact(cls, objs: dict, gen: int):
+        """ Fold the rotated journal into a new snapshot made from `objs`.
+        `gen` is the snapshot generation the rotation happened at.
+        """
+        s_class = cls.__name__
+        tmp_paths = []
+        try:
+            for shard, shard_objs in enumerate(cls._split(objs)):
+                tmp_paths.append(cls._write_tmp_snapshot(shard_objs, shard))
+            with _JOURNAL_LOCK:
+                if _SNAPSHOT_GEN.get(s_class, 0) != gen:
+                    return  # a newer full snapshot was written meanwhile
+                keys = []
+                for shard, tmp_path in enumerate(tmp_paths):
+                    keys.append(_file_key(tmp_path))
+                    os.replace(tmp_path, cls.snapshot_path(shard))
+                tmp_paths = []
+                state = _FILE_STATES.get(s_class)
+                if state is not None:
+                    state['snapshots'] = keys
+                os.remove(".db_{}.journal.old".format(s_class))
+        finally:
+            for tmp_path in tmp_paths:
+                if path.exists(tmp_path):
+                    os.remove(tmp_path)
+            with _JOURNAL_LOCK:
+                _COMPACTING.discard(s_class)
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        self.__class__.save_many([self])
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        self.__class__.remove_many([self.id])
+
+    @classmethod
+    def save_many(cls, objs: Iterable[TypeVar('Base')], touch: bool = True):
+        """ Save all objects of `objs`, writing them to file at once.
+        Their `updated_at` is set to now, unless `touch` is false.
+        """
+        objs = list(objs)
+        if not objs:
+            return
+        now = datetime.utcnow()
+        for obj in objs if touch else ():
+            obj.updated_at = now
+        if STORAGE is not None:
+            return STORAGE.save_many(cls, objs)
+        s_class = cls.__name__
+        with _class_lock(s_class):
+            cls._load_shards(cls.shard_of(obj.id) for obj in objs)
+            changes = {}
+            for obj in objs:
+                cls._unindex(obj.id)
+                DATA[s_class][obj.id] = obj
+                obj._index()
+                changes[obj.id] = obj
+            if FLUSH_INTERVAL > 0:
+                _schedule(cls, changes)
+            else:
+                cls._persist(changes)
+
+    @classmethod
+    def remove_many(cls, ids: Iterable[str]) -> int:
+        """ Remove the objects with the IDs `ids`, writing the change to
+        file at once. Returns the number of objects removed.
+        """
+        ids = list(ids)
+        if STORAGE is not None:
+            return STORAGE.remove_many(cls, ids)
+        s_class = cls.__name__
+        with _class_lock(s_class):
+            cls._load_shards(cls.shard_of(obj_id) for obj_id in ids)
+            changes = {}
+            for obj_id in ids:
+                if obj_id not in DATA[s_class]:
+                    continue
+                cls._unindex(obj_id)
+                del DATA[s_class][obj_id]
+                changes[obj_id] = None
+            if not changes:
+                return 0
+            if FLUSH_INTERVAL > 0:
+                _schedule(cls, changes)
+            else:
+                cls._persist(changes)
+        return len(changes)
+
+    @classmethod
+    def _persist(cls, changes: dict):
+        """ Write the changes `{<id>: <object saved, None if removed>}`
+        to the journal, or the whole class to file
+        """
+        if not JOURNAL_MODE:
+            return cls.save_to_file({cls.shard_of(obj_id)
+                                     for obj_id in changes})
+        records = []
+        for obj_id, obj in changes.items():
+            if obj is None:
+                records.append({'op': 'remove', 'id': obj_id})
+            else:
+                records.append({'op': 'save', 'id': obj_id,
+                                'obj': obj.to_json(True)})
+        cls.append_to_journal(records)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
+        if STORAGE is not None:
+            return STORAGE.count(cls)
+        cls._load_shards()
         s_class = cls.__name__
         return len(DATA[s_class].keys())
 
@@ -114,17 +1037,51 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def stats(cls) -> dict:
+        """ Returns the statistics of the class, kept up to date by
+        `save`/`remove` and the loads: number of objects, number of
+        distinct values of each attribute of `INDEXES`, and number of
+        objects per day of creation and of last update
+        """
+        if STORAGE is not None:
+            return STORAGE.stats(cls)
+        cls._load_shards()
+        s_class = cls.__name__
+        with _class_lock(s_class):
+            indexes = _INDEXES.get(s_class, {})
+            histograms = _HISTOGRAMS.get(s_class, {})
+            distinct = {}
+            for attr in cls.INDEXES:
+                values = indexes.get(attr, {})
+                distinct[attr] = len(values) - (None in values)
+            return {
+                'count': len(DATA.get(s_class, {})),
+                'distinct': distinct,
+                'created_per_day': dict(histograms.get('created_at', {})),
+                'updated_per_day': dict(histograms.get('updated_at', {})),
+            }
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
+        if STORAGE is not None:
+            return STORAGE.get(cls, id)
+        cls._load_shards((cls.shard_of(id),))
         s_class = cls.__name__
         return DATA[s_class].get(id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
-        """ Search all objects with matching attributes
+        """ Search all objects with matching attributes.
+        Only the objects listed by the smallest matching index (if any of
+        `attributes` is in `INDEXES`) are checked, so an indexed attribute
+        changed on an object is only found once the object is saved.
         """
+        if STORAGE is not None:
+            return STORAGE.search(cls, attributes)
+        cls._load_shards()
         s_class = cls.__name__
         def _search(obj):
             if len(attributes) == 0:
@@ -133,5 +1090,226 @@ class Base():
                 if (getattr(obj, k) != v):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+        objs = DATA[s_class]
+        candidates = None
+        indexes = _INDEXES.get(s_class, {})
+        for k, v in attributes.items():
+            if k not in indexes:
+                continue
+            try:
+                ids = _bucket_ids(indexes[k].get(v))
+            except TypeError:   # unhashable value, can't be indexed
+                continue
+            if candidates is None or len(ids) < len(candidates):
+                candidates = ids
+        if candidates is None:
+            return list(filter(_search, list(objs.values())))
+        objs = [objs.get(obj_id) for obj_id in list(candidates)]
+        return list(filter(_search, (obj for obj in objs if obj is not None)))
+
+    @classmethod
+    def query(cls, where: dict = {}, order_by: str = None,
+              limit: int = None, offset: int = 0,
+              after: tuple = None) -> List[TypeVar('Base')]:
+        """ Search objects matching the conditions `where` (`eq`, `gt`,
+        `gte`, `lt`, `lte` or `prefix`, see `models.query`), ordered by the
+        attribute `order_by` (`-<attribute>` for descending order), skipping
+        the first `offset` ones and returning at most `limit` of them.
+        Objects without a value for `order_by` come last.
+        Timestamp strings are accepted for `created_at` and `updated_at`.
+        `after` (with `order_by`) is the `(<order_by value>, <id>)` of the
+        last object of the previous page: only the objects after it are
+        returned (never the ones without a value for `order_by`).
+
+        Candidates come from the most selective hash or sorted index that
+        applies (all objects otherwise). When `order_by` has a sorted index
+        the objects are read in order and the search stops at `limit`.
+        """
+        conditions = []
+        for attr, op, value in parse_conditions(where):
+            if attr in _TIMESTAMP_FIELDS and type(value) is str:
+                value = _to_datetime(value)
+            conditions.append((attr, op, value))
+        reverse = order_by is not None and order_by.startswith('-')
+        order_attr = order_by.lstrip('-') if order_by is not None else None
+        if after is not None and order_attr is None:
+            raise ValueError("`after` requires `order_by`")
+        if STORAGE is not None:
+            return STORAGE.query(cls, conditions, order_attr, reverse,
+                                 limit, offset, after)
+
+        cls._load_shards()
+        s_class = cls.__name__
+        objs = DATA[s_class]
+        stop = None if limit is None else offset + limit
+        # pick the smallest source of candidates: (size, ids, sorted attr)
+        best = None
+        hash_indexes = _INDEXES.get(s_class, {})
+        for attr, op, value in conditions:
+            if op != 'eq' or attr not in hash_indexes:
+                continue
+            try:
+                ids = _bucket_ids(hash_indexes[attr].get(value))
+            except TypeError:   # unhashable value, can't be indexed
+                continue
+            if best is None or len(ids) < best[0]:
+                best = (len(ids), ids, None)
+        sorted_indexes = _SORTED_INDEXES.get(s_class, {})
+        for attr, index in sorted_indexes.items():
+            attr_conditions = [
+                (op, _timestamp_key(value) if attr in _TIMESTAMP_FIELDS
+                 else value) for a, op, value in conditions if a == attr]
+            if not attr_conditions:
+                continue
+            try:
+                start, end = index.bounds(attr_conditions)
+            except TypeError:   # value not comparable with the indexed ones
+                continue
+            if best is None or end - start < best[0]:
+                best = (end - start, (start, end), attr)
+
+        if order_attr in sorted_indexes and \
+                (best is None or best[2] == order_attr):
+            index = sorted_indexes[order_attr]
+            start, end = (0, len(index)) if best is None else best[1]
+            if after is not None:
+                key = after
+                if order_attr in _TIMESTAMP_FIELDS:
+                    key = (_timestamp_key(after[0]), after[1])
+                start, end = index.bounds_after(start, end, key, reverse)
+            results = []
+            for obj_id in index.ids(start, end, reverse):
+                obj = objs.get(obj_id)
+                if obj is not None and matches(obj, conditions):
+                    results.append(obj)
+                    if stop is not None and len(results) >= stop:
+                        return results[offset:]
+            if best is None and after is None:  # not indexed: come last
+                results.extend(
+                    obj for obj in list(objs.values())
+                    if getattr(obj, order_attr, None) is None and
+                    matches(obj, conditions))
+            return results[offset:stop]
+
+        if best is None:
+            candidates = list(objs.values())
+        elif best[2] is None:
+            candidates = [objs.get(obj_id) for obj_id in list(best[1])]
+        else:
+            index = sorted_indexes[best[2]]
+            candidates = [objs.get(obj_id) for obj_id in index.ids(*best[1])]
+        results = [obj for obj in candidates
+                   if obj is not None and matches(obj, conditions)]
+        if after is not None:
+            results = [obj for obj in results
+                       if getattr(obj, order_attr, None) is not None and
+                       ((getattr(obj, order_attr), obj.id) < after if reverse
+                        else (getattr(obj, order_attr), obj.id) > after)]
+        if order_attr is not None:
+            missing = [obj for obj in results
+                       if getattr(obj, order_attr, None) is None]
+            results = [obj for obj in results
+                       if getattr(obj, order_attr, None) is not None]
+            results.sort(key=lambda obj: (getattr(obj, order_attr), obj.id),
+                         reverse=reverse)
+            results.extend(missing)
+        return results[offset:stop]
+
+    def _index_values(self) -> tuple:
+        """ Returns the values of the attributes of `_index_layout` of the
+        object, as in the indexes (stored timestamps are their own keys,
+        but lazy ones)
+        """
+        _, positions, stored, getter = _index_layout(self.__class__)
+        try:
+            values = getter(self)
+        except AttributeError:  # not all set on this object
+            values = tuple(getattr(self, attr, None) for attr in stored)
+        if not LAZY_TIMESTAMPS:
+            return values
+        values = list(values)
+        for i in positions:
+            values[i] = _timestamp_key(values[i])
+        return tuple(values)
+
+    def _keep_indexed_values(self):
+        """ Keep the values the object is indexed with before one of them
+        is changed, for `_unindex`, if it is the indexed object of its id
+        """
+        objs = DATA.get(self.__class__.__name__)
+        obj_id = getattr(self, 'id', None)
+        if objs is None or objs.get(obj_id) is not self:
+            return
+        s_class = self.__class__.__name__
+        kept = _INDEXED_VALUES.setdefault(s_class, {})
+        if obj_id not in kept:
+            kept[obj_id] = self._index_values()
+
+    def _index(self):
+        """ Add the current object (stored in `DATA`) to the indexes of its
+        class
+        """
+        positions = _index_layout(self.__class__)[1]
+        s_class = self.__class__.__name__
+        indexes = _INDEXES.get(s_class)
+        if indexes is None:
+            indexes = _INDEXES.setdefault(
+                s_class, {attr: {} for attr in self.INDEXES})
+            _SORTED_INDEXES.setdefault(
+                s_class, {attr: SortedIndex() for attr in self.SORTED_INDEXES})
+        sorted_indexes = _SORTED_INDEXES[s_class]
+        values = self._index_values()
+        for attr, value in zip(self.INDEXES, values):
+            index = indexes[attr]
+            try:
+                bucket = index.get(value)
+            except TypeError:   # unhashable value, can't be indexed
+                continue
+            if bucket is None:
+                index[value] = self.id
+            elif type(bucket) is dict:
+                bucket[self.id] = None
+            elif bucket != self.id:
+                index[value] = {bucket: None, self.id: None}
+        for attr, value in zip(self.SORTED_INDEXES,
+                               values[len(self.INDEXES):]):
+            sorted_indexes[attr].add(value, self.id)
+        if self.SHARDS > 1:
+            self._shard_ids()[self.shard_of(self.id)][self.id] = None
+        _count_days(s_class, [values[i] for i in positions], 1)
+
+    @classmethod
+    def _unindex(cls, obj_id: str):
+        """ Remove the object `obj_id` from the indexes of the class,
+        before it is replaced or removed in `DATA`
+        """
+        s_class = cls.__name__
+        values = _INDEXED_VALUES.get(s_class, {}).pop(obj_id, None)
+        if values is None:
+            obj = DATA.get(s_class, {}).get(obj_id)
+            if obj is None:
+                return
+            values = obj._index_values()
+        indexes = _INDEXES[s_class]
+        for attr, value in zip(cls.INDEXES, values):
+            index = indexes[attr]
+            try:
+                bucket = index.get(value)
+            except TypeError:
+                continue
+            if type(bucket) is dict:
+                bucket.pop(obj_id, None)
+                if len(bucket) == 1:
+                    index[value] = next(iter(bucket))
+                elif not bucket:
+                    del index[value]
+            elif bucket is not None and bucket == obj_id:
+                del index[value]
+        sorted_indexes = _SORTED_INDEXES[s_class]
+        for attr, value in zip(cls.SORTED_INDEXES, values[len(cls.INDEXES):]):
+            sorted_indexes[attr].discard(value, obj_id)
+        if cls.SHARDS > 1:
+            cls._shard_ids()[cls.shard_of(obj_id)].pop(obj_id, None)
+        positions = _index_layout(cls)[1]
+        _count_days(s_class, [values[i] for i in positions], -1)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+""" Binary snapshot format module
+
+A file is the magic bytes `BDB1` followed by length-prefixed records
+(4 bytes big-endian length, then the `marshal` dump of a tuple). The
+first record is the tuple of field names, every other one is the tuple
+of the field values of one object.
+"""
+from typing import BinaryIO, Iterable, Iterator
+import marshal
+import struct
+
+
+MAGIC = b'BDB1'
+_LENGTH = struct.Struct('>I')
+
+
+def dump(fields: tuple, rows: Iterable[tuple], f: BinaryIO):
+    """ Write the header `fields` then each tuple of `rows` to `f`
+    """
+    chunks = [MAGIC]
+    for row in _with_header(fields, rows):
+        data = marshal.dumps(row)
+        chunks.append(_LENGTH.pack(len(data)))
+        chunks.append(data)
+    f.write(b''.join(chunks))
+
+
+def _with_header(fields: tuple, rows: Iterable[tuple]) -> Iterator[tuple]:
+    """ Yields `fields`, then each tuple of `rows`
+    """
+    yield tuple(fields)
+    yield from rows
+
+
+def load(f: BinaryIO) -> Iterator[dict]:
+    """ Yields one `{<field>: <value>}` dictionary per record of `f`
+    """
+    data = memoryview(f.read())
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a binary snapshot file")
+    offset = len(MAGIC)
+    fields = None
+    while offset < len(data):
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        row = marshal.loads(data[offset:offset + length])
+        offset += length
+        if fields is None:
+            fields = row
+        else:
+            yield dict(zip(fields, row))
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+""" Convert the snapshot files of a model class between formats and
+numbers of shards
+
+Usage: python3 -m models.convert <User|UserSession> <json|binary> [from]
+                                 [--shards N] [--from-shards N]
+(`from` is the current format, by default `DB_FILE_FORMAT` or `json`;
+the numbers of shards default to `DB_SHARDS` or 1)
+"""
+from models.user import User
+from models.user_session import UserSession
+import argparse
+
+
+CLASSES = {'User': User, 'UserSession': UserSession}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        usage=__doc__.strip().split('\n\n')[-1])
+    parser.add_argument('cls', choices=CLASSES)
+    parser.add_argument('format', choices=('json', 'binary'))
+    parser.add_argument('from_format', nargs='?',
+                        choices=('json', 'binary'))
+    parser.add_argument('--shards', type=int)
+    parser.add_argument('--from-shards', type=int)
+    args = parser.parse_args()
+    cls = CLASSES[args.cls]
+    if args.from_format is not None:
+        cls.FILE_FORMAT = args.from_format
+    if args.from_shards is not None:
+        cls.SHARDS = args.from_shards
+    cls.convert_file(args.format, args.shards)
+    print("{}: {} objects written to {}".format(
+        cls.__name__, cls.count(), ", ".join(
+            cls.snapshot_path(shard) for shard in range(cls.SHARDS))))
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+""" Remove the expired UserSession records in one write
+
+Usage: python3 -m models.purge_sessions [duration]
+(`duration` in seconds, by default `SESSION_DURATION`; since the sessions
+were last seen if `SESSION_REFRESH_INTERVAL` > 0, else since created)
+"""
+from models.base import flush
+from models.user_session import UserSession
+from os import getenv
+import sys
+import time
+
+
+if __name__ == "__main__":
+    try:
+        duration = int(sys.argv[1] if len(sys.argv) > 1
+                       else getenv('SESSION_DURATION'))
+    except (TypeError, ValueError):
+        sys.exit(__doc__.strip().split('\n\n')[-1])
+    if duration <= 0:
+        sys.exit("sessions don't expire (duration <= 0)")
+    try:
+        refresh_interval = float(getenv('SESSION_REFRESH_INTERVAL'))
+    except (TypeError, ValueError):
+        refresh_interval = 0
+    start = time.perf_counter()
+    purged = UserSession.purge_expired(
+        duration, 'updated_at' if refresh_interval > 0 else 'created_at')
+    flush()
+    print("{}: {} expired sessions purged in {:.3f}s".format(
+        UserSession.__name__, purged, time.perf_counter() - start))
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+""" Query module: conditions and sorted indexes used by `Base.query`
+
+Conditions are `{'<attribute>__<operator>': <value>}` items (a plain
+`<attribute>` key means `eq`), for example `{'created_at__gte': since,
+'email__prefix': 'bob'}`.
+"""
+from bisect import bisect_left, bisect_right
+from typing import List, Tuple
+import operator
+import threading
+
+
+OPERATORS = {
+    'eq': operator.eq,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'prefix': lambda value, prefix: value.startswith(prefix),
+}
+MAX_CHAR = '\U0010ffff'
+
+
+class _Top():
+    """ Greater than any other value: upper bound of the ids of a value
+    in a sorted index
+    """
+
+    def __lt__(self, other) -> bool:
+        return False
+
+    def __gt__(self, other) -> bool:
+        return True
+
+
+_TOP = _Top()
+
+
+def parse_conditions(where: dict) -> List[Tuple[str, str, object]]:
+    """ Returns the `(<attribute>, <operator>, <value>)` of each condition
+    of `where`. Raises `ValueError` for an unknown operator.
+    """
+    conditions = []
+    for key, value in where.items():
+        attr, _, op = key.partition('__')
+        op = op or 'eq'
+        if op not in OPERATORS:
+            raise ValueError("unknown operator: {}".format(key))
+        conditions.append((attr, op, value))
+    return conditions
+
+
+def matches(obj, conditions: List[Tuple[str, str, object]]) -> bool:
+    """ Returns `True` if `obj` satisfies all `conditions`.
+    A `None` attribute only satisfies `eq`.
+    """
+    for attr, op, value in conditions:
+        obj_value = getattr(obj, attr)
+        if op == 'eq':
+            if obj_value != value:
+                return False
+        elif obj_value is None or not OPERATORS[op](obj_value, value):
+            return False
+    return True
+
+
+class SortedIndex():
+    """ `(<value>, <id>)` entries of one attribute, in order.
+    `None` (and values not comparable with the others) aren't indexed.
+
+    Entries are kept in blocks of at most `2 * BLOCK` (the values and the
+    ids of a block in two lists), so adding or removing one only moves
+    the entries of its block. Added entries are buffered and sorted in
+    at the next read or removal: loading many objects sorts them once.
+    """
+    BLOCK = 512
+
+    def __init__(self):
+        """ Initialize an empty index
+        """
+        self._values = []   # values of each block
+        self._ids = []      # ids of each block, by value then id
+        self._maxes = []    # last `(<value>, <id>)` of each block
+        self._size = 0      # number of entries in the blocks
+        self._pending = []  # `(<value>, <id>)` added, not sorted in yet
+        self._offsets = None    # position of the first entry of each block
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._merge()
+            return self._size
+
+    def add(self, value, obj_id: str):
+        """ Add the entry of `obj_id`
+        """
+        if value is None:
+            return
+        with self._lock:
+            self._pending.append((value, obj_id))
+
+    def merge(self):
+        """ Sort the added entries in now (e.g. once a load is done): they
+        take less memory in the blocks than buffered
+        """
+        with self._lock:
+            self._merge()
+
+    def discard(self, value, obj_id: str):
+        """ Remove the entry of `obj_id`, if any
+        """
+        if value is None:
+            return
+        with self._lock:
+            self._merge()
+            try:
+                i, j = self._find((value, obj_id))
+            except TypeError:
+                return
+            if i == len(self._ids) or j == len(self._ids[i]) or \
+                    self._ids[i][j] != obj_id or self._values[i][j] != value:
+                return
+            del self._values[i][j]
+            del self._ids[i][j]
+            self._size -= 1
+            self._offsets = None
+            if not self._ids[i]:
+                del self._values[i], self._ids[i], self._maxes[i]
+            else:
+                self._maxes[i] = (self._values[i][-1], self._ids[i][-1])
+            # many small blocks left by removals: rebuild them
+            if len(self._ids) > 4 * (self._size // self.BLOCK + 1):
+                self._build(list(self._entries()))
+
+    def bounds(self, conditions: List[Tuple[str, object]]) -> Tuple[int, int]:
+        """ Returns the `(start, stop)` positions of the entries that
+        satisfy all the `(<operator>, <value>)` `conditions`
+        """
+        with self._lock:
+            self._merge()
+            start, stop = 0, self._size
+            for op, value in conditions:
+                if op in ('eq', 'gte', 'prefix'):
+                    start = max(start, self._position((value,)))
+                elif op == 'gt':
+                    start = max(start, self._position((value, _TOP)))
+                if op in ('eq', 'lte'):
+                    stop = min(stop, self._position((value, _TOP)))
+                elif op == 'lt':
+                    stop = min(stop, self._position((value,)))
+                elif op == 'prefix':
+                    stop = min(stop, self._position((value + MAX_CHAR,)))
+        return start, max(start, stop)
+
+    def bounds_after(self, start: int, stop: int, key: tuple,
+                     reverse: bool = False) -> Tuple[int, int]:
+        """ Narrows the `(start, stop)` positions to the entries that come
+        after the `(<value>, <id>)` entry `key` (in descending order if
+        `reverse`)
+        """
+        with self._lock:
+            self._merge()
+            if reverse:
+                stop = min(stop, self._position(key))
+            else:
+                start = max(start, self._position(key, True))
+        return start, max(start, stop)
+
+    def ids(self, start: int = 0, stop: int = None, reverse: bool = False):
+        """ Yields the ids of the entries from `start` to `stop`, without
+        copying them
+        """
+        with self._lock:
+            self._merge()
+            blocks = list(self._ids)
+            offsets = self._block_offsets()
+        stop = self._size if stop is None else stop
+        if start >= stop:
+            return
+        first = bisect_right(offsets, start) - 1
+        last = bisect_right(offsets, stop - 1) - 1
+        order = range(last, first - 1, -1) if reverse else \
+            range(first, last + 1)
+        for i in order:
+            ids = blocks[i]
+            lo = max(start - offsets[i], 0)
+            hi = min(stop - offsets[i], len(ids))
+            positions = range(hi - 1, lo - 1, -1) if reverse else \
+                range(lo, hi)
+            for j in positions:
+                try:
+                    yield ids[j]
+                except IndexError:  # entries removed meanwhile
+                    break
+
+    def _entries(self):
+        """ Yields the `(<value>, <id>)` entries of the blocks, in order
+        """
+        for values, ids in zip(self._values, self._ids):
+            yield from zip(values, ids)
+
+    def _build(self, entries: list):
+        """ Replace the blocks with the sorted `entries`
+        """
+        block = self.BLOCK
+        self._values = [[value for value, _ in entries[i:i + block]]
+                        for i in range(0, len(entries), block)]
+        self._ids = [[obj_id for _, obj_id in entries[i:i + block]]
+                     for i in range(0, len(entries), block)]
+        self._maxes = [(values[-1], ids[-1])
+                       for values, ids in zip(self._values, self._ids)]
+        self._size = len(entries)
+        self._offsets = None
+
+    def _merge(self):
+        """ Sort the entries added since the last read into the blocks
+        (the lock is held)
+        """
+        pending = self._pending
+        if not pending:
+            return
+        self._pending = []
+        if len(pending) * 16 > self._size:   # many: sort everything once
+            entries = list(self._entries())
+            entries.extend(pending)
+            try:
+                entries.sort()
+                self._build(entries)
+                return
+            except TypeError:   # values not comparable: one by one
+                pass
+        for value, obj_id in pending:
+            try:
+                self._insert(value, obj_id)
+            except TypeError:
+                pass
+
+    def _find(self, key: tuple, right: bool = False) -> Tuple[int, int]:
+        """ Returns the `(<block>, <position in the block>)` where `key` (a
+        `(<value>,)` or `(<value>, <id>)` tuple) would be inserted,
+        before the equal entries (after them if `right`)
+        """
+        maxes = self._maxes
+        i = bisect_right(maxes, key) if right else bisect_left(maxes, key)
+        if i == len(maxes):
+            return i, 0
+        values = self._values[i]
+        value = key[0]
+        lo = bisect_left(values, value)
+        hi = bisect_right(values, value, lo)
+        if len(key) == 1:
+            return i, lo
+        if key[1] is _TOP:
+            return i, hi
+        find = bisect_right if right else bisect_left
+        return i, find(self._ids[i], key[1], lo, hi)
+
+    def _position(self, key: tuple, right: bool = False) -> int:
+        """ Returns the position in the whole index of `_find(key)`
+        """
+        i, j = self._find(key, right)
+        if i == len(self._ids):
+            return self._size
+        return self._block_offsets()[i] + j
+
+    def _block_offsets(self) -> List[int]:
+        """ Returns the position of the first entry of each block
+        """
+        if self._offsets is None:
+            offsets = []
+            position = 0
+            for ids in self._ids:
+                offsets.append(position)
+                position += len(ids)
+            self._offsets = offsets
+        return self._offsets
+
+    def _insert(self, value, obj_id: str):
+        """ Insert the entry `(value, obj_id)` in its block, split in two
+        once too big
+        """
+        if not self._ids:
+            self._build([(value, obj_id)])
+            return
+        i, j = self._find((value, obj_id))
+        if i == len(self._ids):  # after all the entries: in the last block
+            i -= 1
+            j = len(self._ids[i])
+        values, ids = self._values[i], self._ids[i]
+        values.insert(j, value)
+        ids.insert(j, obj_id)
+        self._maxes[i] = (values[-1], ids[-1])
+        self._size += 1
+        self._offsets = None
+        if len(ids) > 2 * self.BLOCK:
+            half = len(ids) // 2
+            self._values[i:i + 1] = [values[:half], values[half:]]
+            self._ids[i:i + 1] = [ids[:half], ids[half:]]
+            self._maxes[i:i + 1] = [(values[half - 1], ids[half - 1]),
+                                    (values[-1], ids[-1])]
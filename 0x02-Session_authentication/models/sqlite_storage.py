@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+""" SQLite storage module
+"""
+from datetime import datetime
+from typing import TypeVar, List
+import os
+import sqlite3
+import threading
+from models.query import MAX_CHAR
+
+
+_SQL_OPERATORS = {'eq': '=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+# `(<stat>, <column>)` of the counters of rows per day in the stats tables
+_PER_DAY = (('created_per_day', 'created_at'),
+            ('updated_per_day', 'updated_at'))
+
+
+class SQLiteStorage():
+    """ Stores model objects in a SQLite database (one table per class,
+    one column per attribute in `FIELDS`) instead of in `DATA`.
+    Objects are built from their row on each read.
+    The statistics of each class are counters in a `<Class>_stats` table
+    (`stat`, `key`, `n`), kept up to date by triggers in the transaction
+    of each write.
+    """
+
+    def __init__(self, db_path: str):
+        """ Initialize the storage for the database file `db_path`
+        """
+        self.db_path = db_path
+        self._local = threading.local()     # one connection per thread
+        self._tables = set()
+        self._tables_lock = threading.Lock()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """ Connection of the current thread
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5,
+                                   isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            # a replaced row fires the delete triggers (see `_stats_table`)
+            conn.execute('PRAGMA recursive_triggers=ON')
+            self._local.conn = conn
+        return conn
+
+    def _table(self, cls) -> str:
+        """ Returns the quoted table name of `cls`, creating the table
+        (and its indexes and missing columns) the first time
+        """
+        table = '"{}"'.format(cls.__name__)
+        if cls.__name__ in self._tables:
+            return table
+        with self._tables_lock:
+            conn = self._conn
+            columns = ', '.join('"{}"'.format(f) for f in cls.FIELDS[1:])
+            conn.execute('CREATE TABLE IF NOT EXISTS {} '
+                         '(id TEXT PRIMARY KEY, {})'.format(table, columns))
+            existing = [row[1] for row in
+                        conn.execute('PRAGMA table_info({})'.format(table))]
+            for field in cls.FIELDS:
+                if field not in existing:
+                    conn.execute('ALTER TABLE {} ADD COLUMN "{}"'.format(
+                        table, field))
+            for attr in cls.INDEXES + cls.SORTED_INDEXES:
+                conn.execute('CREATE INDEX IF NOT EXISTS "{0}_{1}" '
+                             'ON {2} ("{1}")'.format(cls.__name__, attr,
+                                                     table))
+            self._stats_table(cls, table)
+            self._tables.add(cls.__name__)
+        return table
+
+    def _stats_table(self, cls, table: str):
+        """ Creates the stats table of `cls` and its triggers, filled from
+        the rows once, or again if `INDEXES` changed
+        """
+        stats = '"{}_stats"'.format(cls.__name__)
+        layout = ','.join(cls.INDEXES)
+        conn = self._conn
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')     # one process fills it
+            conn.execute('CREATE TABLE IF NOT EXISTS {} (stat TEXT, key '
+                         'TEXT, n INTEGER, PRIMARY KEY (stat, key))'.format(
+                             stats))
+            if conn.execute('SELECT 1 FROM {} WHERE stat = ? AND key = ?'
+                            .format(stats), ('layout', layout)).fetchone():
+                return
+            for event in ('insert', 'delete'):
+                conn.execute('DROP TRIGGER IF EXISTS "{}_stats_{}"'.format(
+                    cls.__name__, event))
+            conn.execute('DELETE FROM {}'.format(stats))
+            self._create_stats_triggers(cls, table, stats)
+            conn.execute('INSERT INTO {} VALUES (?, ?, 0)'.format(stats),
+                         ('layout', layout))
+            conn.execute("INSERT INTO {} SELECT 'count', '', COUNT(*) "
+                         "FROM {}".format(stats, table))
+            for attr in cls.INDEXES:
+                conn.execute('INSERT INTO {0} SELECT \'distinct\', ?, '
+                             'COUNT(DISTINCT "{1}") FROM {2}'.format(
+                                 stats, attr, table), (attr,))
+            for stat, attr in _PER_DAY:
+                conn.execute('INSERT INTO {0} SELECT ?, substr("{1}", 1, '
+                             '10), COUNT(*) FROM {2} WHERE "{1}" IS NOT '
+                             'NULL GROUP BY 2'.format(stats, attr, table),
+                             (stat,))
+
+    def _create_stats_triggers(self, cls, table: str, stats: str):
+        """ Creates the triggers counting the inserted and deleted rows of
+        `cls` in its stats table: a value counts as distinct while a row
+        has it, checked with the index of its column
+        """
+        on_insert = ["UPDATE {0} SET n = n + 1 WHERE stat = 'count';"]
+        on_delete = ["UPDATE {0} SET n = n - 1 WHERE stat = 'count';"]
+        for attr in cls.INDEXES:
+            on_insert.append(
+                "UPDATE {{0}} SET n = n + 1 WHERE stat = 'distinct' AND "
+                "key = '{0}' AND NEW.\"{0}\" IS NOT NULL AND NOT EXISTS "
+                "(SELECT 1 FROM {{1}} WHERE \"{0}\" = NEW.\"{0}\" AND "
+                "id != NEW.id);".format(attr))
+            on_delete.append(
+                "UPDATE {{0}} SET n = n - 1 WHERE stat = 'distinct' AND "
+                "key = '{0}' AND OLD.\"{0}\" IS NOT NULL AND NOT EXISTS "
+                "(SELECT 1 FROM {{1}} WHERE \"{0}\" = OLD.\"{0}\");"
+                .format(attr))
+        for stat, attr in _PER_DAY:
+            # no `OR IGNORE`: the `OR REPLACE` of the write overrides it
+            on_insert.append(
+                "UPDATE {{0}} SET n = n + 1 WHERE stat = '{0}' AND key = "
+                "substr(NEW.\"{1}\", 1, 10);"
+                "INSERT INTO {{0}} SELECT '{0}', substr(NEW.\"{1}\", 1, "
+                "10), 1 WHERE NEW.\"{1}\" IS NOT NULL AND NOT EXISTS "
+                "(SELECT 1 FROM {{0}} WHERE stat = '{0}' AND key = "
+                "substr(NEW.\"{1}\", 1, 10));".format(stat, attr))
+            on_delete.append(
+                "UPDATE {{0}} SET n = n - 1 WHERE stat = '{0}' AND key = "
+                "substr(OLD.\"{1}\", 1, 10);"
+                "DELETE FROM {{0}} WHERE stat = '{0}' AND key = "
+                "substr(OLD.\"{1}\", 1, 10) AND n <= 0;".format(stat, attr))
+        for event, statements in (('insert', on_insert),
+                                  ('delete', on_delete)):
+            self._conn.execute(
+                'CREATE TRIGGER "{0}_stats_{1}" AFTER {2} ON {3} BEGIN {4} '
+                'END'.format(cls.__name__, event, event.upper(), table,
+                             ' '.join(statements).format(stats, table)))
+
+    def _select(self, cls, where: str = '', params: tuple = ()) -> list:
+        """ Returns the objects of the rows of `cls` matching `where`
+        """
+        table = self._table(cls)
+        columns = ', '.join('"{}"'.format(f) for f in cls.FIELDS)
+        cursor = self._conn.execute('SELECT {} FROM {} {}'.format(
+            columns, table, where), params)
+        return [cls(**dict(zip(cls.FIELDS, row))) for row in cursor]
+
+    def file_keys(self) -> tuple:
+        """ Returns the size and modification time of the database file
+        and of its write-ahead log
+        """
+        keys = []
+        for file_path in (self.db_path, self.db_path + '-wal'):
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                keys.append(None)
+                continue
+            keys.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        return tuple(keys)
+
+    def load(self, cls):
+        """ Make sure the table of `cls` exists
+        """
+        self._table(cls)
+
+    def save_many(self, cls, objs: List[TypeVar('Base')]):
+        """ Insert or update the rows of `objs` in one transaction
+        """
+        table = self._table(cls)
+        rows = []
+        for obj in objs:
+            obj_json = obj.to_json(True)
+            rows.append(tuple(obj_json.get(f) for f in cls.FIELDS))
+        sql = 'INSERT OR REPLACE INTO {} ({}) VALUES ({})'.format(
+            table, ', '.join('"{}"'.format(f) for f in cls.FIELDS),
+            ', '.join('?' * len(cls.FIELDS)))
+        conn = self._conn
+        with conn:
+            conn.execute('BEGIN')
+            conn.executemany(sql, rows)
+
+    def remove_many(self, cls, ids: List[str]) -> int:
+        """ Delete the rows with the IDs `ids` in one transaction.
+        Returns the number of rows deleted.
+        """
+        table = self._table(cls)
+        conn = self._conn
+        with conn:
+            conn.execute('BEGIN')
+            cursor = conn.executemany(
+                'DELETE FROM {} WHERE id = ?'.format(table),
+                [(obj_id,) for obj_id in ids])
+        return cursor.rowcount
+
+    def count(self, cls) -> int:
+        """ Number of rows of `cls`
+        """
+        table = self._table(cls)
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM {}'.format(table)).fetchone()[0]
+
+    def stats(self, cls) -> dict:
+        """ Statistics of `cls` (see `Base.stats`), read from the counters
+        of its stats table
+        """
+        self._table(cls)
+        stats = {'count': 0, 'distinct': dict.fromkeys(cls.INDEXES, 0)}
+        for stat, _ in _PER_DAY:
+            stats[stat] = {}
+        for stat, key, n in self._conn.execute(
+                'SELECT stat, key, n FROM "{}_stats" ORDER BY stat, key'
+                .format(cls.__name__)):
+            if stat == 'count':
+                stats['count'] = n
+            elif stat == 'distinct':
+                stats['distinct'][key] = n
+            elif stat in stats:
+                stats[stat][key] = n
+        return stats
+
+    def get(self, cls, id: str) -> TypeVar('Base'):
+        """ Returns the object of `cls` with the ID `id`, or `None`
+        """
+        objs = self._select(cls, 'WHERE id = ?', (id,))
+        return objs[0] if objs else None
+
+    def search(self, cls, attributes: dict = {}) -> List[TypeVar('Base')]:
+        """ Returns the objects of `cls` with matching attributes
+        """
+        return self.query(cls, [(k, 'eq', v) for k, v in attributes.items()])
+
+    def query(self, cls, conditions: list, order_by: str = None,
+              reverse: bool = False, limit: int = None, offset: int = 0,
+              after: tuple = None) -> List[TypeVar('Base')]:
+        """ Returns the objects of `cls` matching the `(<attribute>,
+        <operator>, <value>)` `conditions` (see `Base.query`)
+        """
+        from models.base import TIMESTAMP_FORMAT
+        where = []
+        params = []
+        for k, op, v in conditions:
+            if k not in cls.FIELDS:
+                return []
+            if type(v) is datetime:
+                v = v.strftime(TIMESTAMP_FORMAT)
+            if v is None:
+                where.append('"{}" IS NULL'.format(k) if op == 'eq' else '0')
+            elif op == 'prefix':    # a range, unlike LIKE it uses the index
+                where.append('"{0}" >= ? AND "{0}" < ?'.format(k))
+                params.extend((v, v + MAX_CHAR))
+            else:
+                where.append('"{}" {} ?'.format(k, _SQL_OPERATORS[op]))
+                params.append(v)
+        if after is not None:
+            value, obj_id = after
+            if type(value) is datetime:
+                value = value.strftime(TIMESTAMP_FORMAT)
+            where.append('("{0}" {1} ? OR ("{0}" = ? AND id {1} ?))'.format(
+                order_by, '<' if reverse else '>'))
+            params.extend((value, value, obj_id))
+        sql = 'WHERE ' + ' AND '.join(where) if where else ''
+        if order_by is not None:
+            if order_by not in cls.FIELDS:
+                raise AttributeError(order_by)
+            direction = 'DESC' if reverse else 'ASC'
+            # NULL values last, then the id to break ties
+            sql += ' ORDER BY "{0}" IS NULL, "{0}" {1}, id {1}'.format(
+                order_by, direction)
+        if limit is not None or offset:
+            sql += ' LIMIT ? OFFSET ?'
+            params.extend((-1 if limit is None else limit, offset))
+        return self._select(cls, sql, tuple(params))
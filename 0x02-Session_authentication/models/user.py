@@ -2,12 +2,17 @@
 """ User module
 """
 import hashlib
-from models.base import Base
+from models.base import Base, COMPACT_MODELS
 
 
 class User(Base):
     """ User class
     """
+    INDEXES = ('email',)
+    SORTED_INDEXES = Base.SORTED_INDEXES + ('email',)
+    FIELDS = Base.FIELDS + ('email', '_password', 'first_name', 'last_name')
+    if COMPACT_MODELS:
+        __slots__ = FIELDS[len(Base.FIELDS):]
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
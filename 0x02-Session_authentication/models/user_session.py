@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 """ UserSession module
 """
+from datetime import datetime, timedelta
 import hashlib
-from models.base import Base
+from models.base import Base, COMPACT_MODELS
 
 
 class UserSession(Base):
     """ UserSession class
     """
+    INDEXES = ('session_id', 'user_id')
+    FIELDS = Base.FIELDS + ('user_id', 'session_id')
+    if COMPACT_MODELS:
+        __slots__ = FIELDS[len(Base.FIELDS):]
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a UserSession instance
@@ -15,3 +20,15 @@ class UserSession(Base):
         super().__init__(*args, **kwargs)
         self.user_id = kwargs.get('user_id')
         self.session_id = kwargs.get('session_id')
+
+    @classmethod
+    def purge_expired(cls, duration: int, attr: str = 'created_at') -> int:
+        """ Remove the sessions whose `attr` (`created_at`, or
+        `updated_at`: last seen) is more than `duration` seconds ago,
+        found with its sorted index, in one write.
+        Returns the number of sessions removed.
+        """
+        cls.load_from_file()
+        expired_before = datetime.utcnow() - timedelta(seconds=duration)
+        expired = cls.query({attr + '__lt': expired_before})
+        return cls.remove_many([user_session.id for user_session in expired])
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+""" Tests of the cache of the verified `Authorization` headers of
+`BasicAuth`
+
+Usage: python3 -m unittest discover tests (from the project directory)
+"""
+import os
+import tempfile
+import unittest
+from base64 import b64encode
+from types import SimpleNamespace
+from unittest import mock
+
+from api.v1.auth.basic_auth import BasicAuth
+from models.user import User
+
+
+class TestBasicAuthCache(unittest.TestCase):
+    """ Cached users are trusted until the TTL, and no longer once their
+    password or email changed or they were removed """
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(tmp_dir.name)
+        self.addCleanup(os.chdir, cwd)
+        patcher = mock.patch.dict(os.environ, {'BASIC_AUTH_CACHE_SIZE': '2',
+                                               'BASIC_AUTH_CACHE_TTL': '60'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        User.load_from_file()   # nothing from another directory
+        self.user = User(email='bob@example.com')
+        self.user.password = 'pwd'
+        self.user.save()
+        self.auth = BasicAuth()
+
+    @staticmethod
+    def request(email: str, password: str):
+        """ Returns a request with the Basic credentials `email` and
+        `password` """
+        credentials = b64encode('{}:{}'.format(email, password).encode())
+        return SimpleNamespace(headers={
+            'Authorization': 'Basic ' + credentials.decode()})
+
+    def checks(self):
+        """ Counts the checks of credentials (cache misses) """
+        return mock.patch.object(
+            BasicAuth, 'user_object_from_credentials', autospec=True,
+            side_effect=BasicAuth.user_object_from_credentials)
+
+    def test_cached(self):
+        request = self.request('bob@example.com', 'pwd')
+        with self.checks() as checks:
+            for _ in range(3):
+                self.assertEqual(self.auth.current_user(request).id,
+                                 self.user.id)
+        self.assertEqual(checks.call_count, 1)
+        self.assertIsNone(self.auth.current_user(
+            self.request('bob@example.com', 'wrong')))
+
+    def test_password_change(self):
+        request = self.request('bob@example.com', 'pwd')
+        self.assertIsNotNone(self.auth.current_user(request))
+        self.user.password = 'new'
+        self.user.save()
+        self.assertIsNone(self.auth.current_user(request))
+        self.assertEqual(self.auth.current_user(self.request(
+            'bob@example.com', 'new')).id, self.user.id)
+
+    def test_email_change(self):
+        request = self.request('bob@example.com', 'pwd')
+        self.assertIsNotNone(self.auth.current_user(request))
+        self.user.email = 'alice@example.com'
+        self.user.save()
+        self.assertIsNone(self.auth.current_user(request))
+
+    def test_removal(self):
+        request = self.request('bob@example.com', 'pwd')
+        self.assertIsNotNone(self.auth.current_user(request))
+        self.user.remove()
+        self.assertIsNone(self.auth.current_user(request))
+
+    def test_ttl(self):
+        request = self.request('bob@example.com', 'pwd')
+        now = 1000.0
+        clock = SimpleNamespace(monotonic=lambda: now)
+        with mock.patch('api.v1.auth.basic_auth.time', clock), \
+                self.checks() as checks:
+            self.auth.current_user(request)
+            now += 59
+            self.auth.current_user(request)
+            self.assertEqual(checks.call_count, 1)
+            now += 2    # expired: checked again
+            self.assertEqual(self.auth.current_user(request).id,
+                             self.user.id)
+            self.assertEqual(checks.call_count, 2)
+
+    def test_least_recently_used_evicted(self):
+        for email in ('eve@example.com', 'carol@example.com'):
+            user = User(email=email)
+            user.password = 'pwd'
+            user.save()
+        bob, eve, carol = (self.request(email, 'pwd') for email in (
+            'bob@example.com', 'eve@example.com', 'carol@example.com'))
+        with self.checks() as checks:
+            for request in (bob, eve, bob, carol):  # 2 kept: evicts eve
+                self.auth.current_user(request)
+            self.assertEqual(checks.call_count, 3)
+            self.auth.current_user(bob)
+            self.assertEqual(checks.call_count, 3)
+            self.assertIsNotNone(self.auth.current_user(eve))
+            self.assertEqual(checks.call_count, 4)
+
+    def test_disabled(self):
+        os.environ['BASIC_AUTH_CACHE_SIZE'] = '0'
+        auth = BasicAuth()
+        request = self.request('bob@example.com', 'pwd')
+        with self.checks() as checks:
+            auth.current_user(request)
+            auth.current_user(request)
+        self.assertEqual(checks.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+""" Tests of the cache of the sessions read from database by
+`SessionDBAuth`
+
+Usage: python3 -m unittest discover tests (from the project directory)
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from api.v1.auth.session_db_auth import SessionDBAuth
+from models.user_session import UserSession
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestSessionDBAuthCache(unittest.TestCase):
+    """ The cache stays valid across the writes of the process itself
+    and is dropped when another process writes """
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(tmp_dir.name)
+        self.addCleanup(os.chdir, cwd)
+        patcher = mock.patch.dict(os.environ, {'SESSION_DURATION': '0',
+                                               'SESSION_NAME': '_session_id'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        UserSession.load_from_file()    # nothing from another directory
+
+    @staticmethod
+    def request(session_id: str):
+        """ Returns a request with the session cookie `session_id` """
+        return SimpleNamespace(cookies={'_session_id': session_id},
+                               headers={})
+
+    def from_cache(self):
+        """ Fails on any read of the files """
+        return mock.patch.object(UserSession, 'load_from_file',
+                                 side_effect=AssertionError('files read'))
+
+    def test_own_writes_keep_the_cache(self):
+        auth = SessionDBAuth()
+        session_id = auth.create_session('user1')
+        self.assertEqual(auth.user_id_for_session_id(session_id), 'user1')
+        other = auth.create_session('user2')
+        with self.from_cache():
+            self.assertEqual(auth.user_id_for_session_id(session_id),
+                             'user1')
+            self.assertEqual(auth.user_id_for_session_id(other), 'user2')
+        self.assertTrue(auth.destroy_session(self.request(other)))
+        with self.from_cache():
+            self.assertEqual(auth.user_id_for_session_id(session_id),
+                             'user1')
+        self.assertIsNone(auth.user_id_for_session_id(other))
+
+    def test_other_process_write_drops_the_cache(self):
+        auth = SessionDBAuth()
+        session_id = auth.create_session('user1')
+        self.assertEqual(auth.user_id_for_session_id(session_id), 'user1')
+        subprocess.run([sys.executable, '-c', '''
+from models.user_session import UserSession
+UserSession.load_from_file()
+UserSession.search({{'session_id': '{}'}})[0].remove()
+'''.format(session_id)], check=True, env=dict(os.environ, PYTHONPATH=ROOT))
+        self.assertIsNone(auth.user_id_for_session_id(session_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+""" Tests of `SessionSignedAuth`: signing, key rotation, expiry and
+revocation of the signed session cookies
+
+Usage: python3 -m unittest discover tests (from the project directory)
+"""
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from api.v1.auth.session_signed_auth import SessionSignedAuth
+
+
+class NoStore:
+    """ Fails on any access: requests must not read the revocations
+    store """
+    def __getattr__(self, name):
+        raise AssertionError("store accessed: {}".format(name))
+
+    def __contains__(self, key):
+        raise AssertionError("store accessed: in")
+
+    def __getitem__(self, key):
+        raise AssertionError("store accessed: []")
+
+
+class TestSessionSignedAuth(unittest.TestCase):
+    """ Session cookies signed by `SessionSignedAuth` """
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        env = {'SESSION_SECRET': 'key1', 'SESSION_DURATION': '60',
+               'SESSION_NAME': '_session_id', 'SESSION_SYNC_INTERVAL': '0',
+               'SESSION_STORE_PATH': os.path.join(tmp_dir.name, 's.db')}
+        patcher = mock.patch.dict(os.environ, env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def request(session_id: str):
+        """ Returns a request with the session cookie `session_id` """
+        return SimpleNamespace(cookies={'_session_id': session_id},
+                               headers={})
+
+    def test_sign_and_verify(self):
+        auth = SessionSignedAuth()
+        session_id = auth.create_session('user1')
+        self.assertEqual(auth.user_id_for_session_id(session_id), 'user1')
+        user_id, expiry, key_id, signature = session_id.rsplit('.', 3)
+        self.assertEqual(key_id, auth.signing_key_id)
+        self.assertAlmostEqual(int(expiry) / 1000, time.time() + 60,
+                               delta=5)
+        for forged in ('user2.{}.{}.{}'.format(expiry, key_id, signature),
+                       '{}.{}.{}.{}'.format(user_id, int(expiry) + 1,
+                                            key_id, signature),
+                       session_id[:-1] + ('A' if session_id[-1] != 'A'
+                                          else 'B'),
+                       session_id + 'é', session_id + '\udc80',
+                       'user1.x.y.z', 'user1', '', None, 42):
+            self.assertIsNone(auth.user_id_for_session_id(forged), forged)
+        # a process with the same key verifies it, another one doesn't
+        self.assertEqual(SessionSignedAuth().user_id_for_session_id(
+            session_id), 'user1')
+        os.environ['SESSION_SECRET'] = 'key2'
+        self.assertIsNone(SessionSignedAuth().user_id_for_session_id(
+            session_id))
+
+    def test_key_rotation(self):
+        old = SessionSignedAuth()
+        old_session = old.create_session('user1')
+        os.environ['SESSION_SECRET'] = 'key2,key1'
+        rotated = SessionSignedAuth()
+        new_session = rotated.create_session('user1')
+        self.assertNotEqual(rotated.signing_key_id, old.signing_key_id)
+        self.assertEqual(rotated.user_id_for_session_id(old_session),
+                         'user1')
+        self.assertEqual(rotated.user_id_for_session_id(new_session),
+                         'user1')
+        self.assertIsNone(old.user_id_for_session_id(new_session))
+        os.environ['SESSION_SECRET'] = 'key2'
+        retired = SessionSignedAuth()
+        self.assertIsNone(retired.user_id_for_session_id(old_session))
+        self.assertEqual(retired.user_id_for_session_id(new_session),
+                         'user1')
+
+    def test_expiry(self):
+        auth = SessionSignedAuth()
+        key = auth.keys[auth.signing_key_id]
+        now = int(time.time() * 1000)
+        for expiry, user_id in ((now - 1000, None), (now + 1000, 'user1')):
+            session_id = 'user1.{}.{}.{}'.format(
+                expiry, auth.signing_key_id, auth.sign(key, 'user1', expiry))
+            self.assertEqual(auth.user_id_for_session_id(session_id),
+                             user_id)
+
+    def test_duration_required(self):
+        for duration in (None, '0', '-5', 'x'):
+            with mock.patch.dict(os.environ):
+                os.environ.pop('SESSION_DURATION')
+                if duration is not None:
+                    os.environ['SESSION_DURATION'] = duration
+                with self.assertRaises(ValueError):
+                    SessionSignedAuth()
+
+    def test_revocation(self):
+        auth = SessionSignedAuth()
+        older = auth.create_session('user1')
+        time.sleep(0.002)
+        session_id = auth.create_session('user1')
+        other = auth.create_session('user2')
+        self.assertTrue(auth.destroy_session(self.request(session_id)))
+        self.assertFalse(auth.destroy_session(self.request(session_id)))
+        self.assertIsNone(auth.user_id_for_session_id(session_id))
+        self.assertIsNone(auth.user_id_for_session_id(older))
+        self.assertEqual(auth.user_id_for_session_id(other), 'user2')
+        # logging in again right away gives a valid session
+        again = auth.create_session('user1')
+        self.assertEqual(auth.user_id_for_session_id(again), 'user1')
+        self.assertFalse(auth.destroy_session(None))
+        self.assertFalse(auth.destroy_session(self.request('bad')))
+
+    def test_revocations_are_shared(self):
+        auth, other = SessionSignedAuth(), SessionSignedAuth()
+        session_id = auth.create_session('user1')
+        self.assertTrue(auth.destroy_session(self.request(session_id)))
+        other.sync_revocations()
+        self.assertIsNone(other.user_id_for_session_id(session_id))
+        # a process started later reads them too
+        late = SessionSignedAuth()
+        late.sync_revocations()
+        self.assertIsNone(late.user_id_for_session_id(session_id))
+
+    def test_revocations_in_memory(self):
+        os.environ['SESSION_STORE'] = 'memory'
+        auth = SessionSignedAuth()
+        self.assertIsNone(auth.revocations)
+        session_id = auth.create_session('user1')
+        self.assertTrue(auth.destroy_session(self.request(session_id)))
+        self.assertIsNone(auth.user_id_for_session_id(session_id))
+
+    def test_requests_dont_read_the_store(self):
+        auth = SessionSignedAuth()
+        session_id = auth.create_session('user1')
+        revoked = auth.create_session('user2')
+        auth.destroy_session(self.request(revoked))
+        auth.revocations = NoStore()
+        self.assertEqual(auth.user_id_for_session_id(session_id), 'user1')
+        self.assertIsNone(auth.user_id_for_session_id(revoked))
+
+    def test_many_logouts_dont_block_logins(self):
+        auth = SessionSignedAuth()
+        for _ in range(200):
+            session_id = auth.create_session('user1')
+            self.assertEqual(auth.user_id_for_session_id(session_id),
+                             'user1')
+            self.assertTrue(auth.destroy_session(self.request(session_id)))
+        # one revocation per user, forgotten once the sessions expired
+        self.assertEqual(len(auth.revoked_before), 1)
+        auth.revoked_before['user1'] = int(time.time() * 1000) - 1
+        auth.revocations = None
+        auth.sync_revocations()
+        self.assertEqual(auth.revoked_before, {})
+        self.assertEqual(auth.user_id_for_session_id(
+            auth.create_session('user2')), 'user2')
+
+
+if __name__ == '__main__':
+    unittest.main()
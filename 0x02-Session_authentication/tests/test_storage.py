@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+""" Regression tests of the storage of the models in each `DB_*` mode.
+The settings are read when `models.base` is imported: each scenario runs
+its steps in new Python processes, in a temporary directory.
+
+Usage: python3 -m unittest discover tests (from the project directory)
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = {
+    'default': {},
+    'journal': {'DB_JOURNAL': '1'},
+    'binary': {'DB_FILE_FORMAT': 'binary'},
+    'compact': {'DB_COMPACT_MODELS': '1'},
+    'lazy_timestamps': {'DB_LAZY_TIMESTAMPS': '1'},
+    'shards': {'DB_SHARDS': '3'},
+    'lazy_shards': {'DB_SHARDS': '3', 'DB_SHARD_LOAD': 'lazy'},
+    'write_behind': {'DB_FLUSH_INTERVAL': '60'},
+    'sqlite': {'DB_STORAGE': 'sqlite'},
+}
+
+# `prelude.py`, imported by every process: `dump()` returns the users
+# loaded from the files, sorted by id, once it checked the indexes agree
+PRELUDE = '''
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+import models.base as base
+from models.user import User
+
+
+def new_users(count, name):
+    start = datetime(2026, 1, 1)
+    return [User(email='{}{}@example.com'.format(name, i),
+                 first_name=name,
+                 created_at=start + timedelta(minutes=i))
+            for i in range(count)]
+
+
+def dump():
+    User.load_from_file()
+    users = sorted((user.to_json(True) for user in User.all()),
+                   key=lambda user: user['id'])
+    for user in users:
+        found = User.search({'email': user['email']})
+        assert [u.id for u in found] == [user['id']], user
+    ordered = sorted(users, key=lambda user: (user['created_at'],
+                                              user['id']))
+    assert [u.id for u in User.query(order_by='created_at')] == \\
+        [user['id'] for user in ordered]
+    assert User.count() == len(users)
+    return users
+'''
+
+
+class StorageTestCase(unittest.TestCase):
+    """ Runs the steps of a scenario in a temporary directory """
+
+    def setUp(self):
+        self._tmp_dir = None
+        self.new_dir()
+        self.addCleanup(lambda: self._tmp_dir.cleanup())
+
+    def run_step(self, code: str, settings: dict = {}):
+        """ Runs `code` in a new process with the `DB_*` `settings`,
+        returns the JSON value of its last line of output (`None` if
+        there is no output)
+        """
+        env = {key: value for key, value in os.environ.items()
+               if not key.startswith('DB_')}
+        env.update(settings, PYTHONPATH=ROOT)
+        script = 'from prelude import *\n' + textwrap.dedent(code)
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=self._tmp_dir.name,
+            env=env, capture_output=True, text=True, timeout=300)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        lines = result.stdout.splitlines()
+        return json.loads(lines[-1]) if lines else None
+
+    def new_dir(self):
+        """ Starts in a new directory, with only `prelude.py` """
+        if self._tmp_dir is not None:
+            self._tmp_dir.cleanup()
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self._tmp_dir.name, 'prelude.py'), 'w') as f:
+            f.write(PRELUDE)
+
+
+class TestRoundTrip(StorageTestCase):
+    """ What a process saves and removes is what the next one loads """
+
+    def test_save_remove_load(self):
+        for mode, settings in MODES.items():
+            with self.subTest(mode=mode):
+                self.new_dir()
+                saved = self.run_step('''
+                    users = new_users(30, 'a')
+                    User.save_many(users[:20])
+                    for user in users[20:]:
+                        user.save()
+                    users[3].email = 'changed@example.com'
+                    users[3].save()
+                    User.remove_many([user.id for user in users[:5]])
+                    users[25].remove()
+                    print(json.dumps(dump()))
+                ''', settings)
+                self.assertEqual(len(saved), 24)
+                self.assertEqual(self.run_step('''
+                    print(json.dumps(dump()))
+                ''', settings), saved)
+                # and again after changes on top of loaded objects
+                changed = self.run_step('''
+                    User.load_from_file()
+                    user = User.search({'email': 'a10@example.com'})[0]
+                    user.email = 'moved@example.com'
+                    user.save()
+                    User.search({'email': 'a11@example.com'})[0].remove()
+                    User.save_many(new_users(3, 'b'))
+                    print(json.dumps(dump()))
+                ''', settings)
+                self.assertEqual(len(changed), 26)
+                self.assertEqual(self.run_step('''
+                    print(json.dumps(dump()))
+                ''', settings), changed)
+
+
+class TestConcurrency(StorageTestCase):
+    """ Threads saving, removing and searching at once """
+
+    def test_concurrent_save_and_search(self):
+        for mode in ('default', 'journal', 'shards', 'write_behind'):
+            with self.subTest(mode=mode):
+                self.new_dir()
+                saved = self.run_step('''
+                    import threading
+                    errors = []
+                    done = threading.Event()
+                    users = new_users(400, 'c')
+                    removed = [user.id for user in users[::10]]
+
+                    def write(chunk):
+                        try:
+                            for user in chunk:
+                                user.save()
+                            User.remove_many(
+                                [user.id for user in chunk
+                                 if user.id in removed])
+                        except Exception as e:
+                            errors.append(repr(e))
+
+                    def read():
+                        try:
+                            while not done.is_set():
+                                for user in User.all():
+                                    User.search({'email': user.email})
+                                User.query({'created_at__gte':
+                                            '2026-01-01T01:00:00'},
+                                           order_by='created_at', limit=5)
+                                User.count()
+                        except Exception as e:
+                            errors.append(repr(e))
+
+                    writers = [threading.Thread(target=write,
+                                                args=(users[i::4],))
+                               for i in range(4)]
+                    readers = [threading.Thread(target=read)
+                               for _ in range(4)]
+                    for thread in writers + readers:
+                        thread.start()
+                    for thread in writers:
+                        thread.join()
+                    done.set()
+                    for thread in readers:
+                        thread.join()
+                    assert not errors, errors
+                    base.flush()
+                    print(json.dumps(dump()))
+                ''', MODES[mode])
+                self.assertEqual(len(saved), 360)
+                self.assertEqual(self.run_step('''
+                    print(json.dumps(dump()))
+                ''', MODES[mode]), saved)
+
+
+class TestJournal(StorageTestCase):
+    """ Compaction of the journal into a snapshot, and its replay """
+
+    def test_compaction(self):
+        settings = dict(MODES['journal'], DB_JOURNAL_COMPACT_SIZE='4000')
+        saved = self.run_step('''
+            import os
+            for user in new_users(100, 'd'):
+                user.save()
+            while base._COMPACTING:     # records were added meanwhile
+                time.sleep(0.01)
+            # compacted again if they went over the size
+            User.search({'email': 'd7@example.com'})[0].remove()
+            while base._COMPACTING:
+                time.sleep(0.01)
+            assert os.path.exists('.db_User.json')
+            assert not os.path.exists('.db_User.journal.old')
+            assert not os.path.exists('.db_User.journal') or \
+                os.path.getsize('.db_User.journal') < 4000
+            print(json.dumps(dump()))
+        ''', settings)
+        self.assertEqual(len(saved), 99)
+        self.assertEqual(self.run_step('''
+            print(json.dumps(dump()))
+        ''', settings), saved)
+
+    def test_compaction_keeps_other_processes_records(self):
+        settings = dict(MODES['journal'], DB_JOURNAL_COMPACT_SIZE='4000')
+        saved = self.run_step('''
+            import os
+            import subprocess
+            User.save_many(new_users(5, 'h'))
+            # another process appends records this one didn't read
+            other = subprocess.run([sys.executable, '-c', """
+            from prelude import *
+            User.load_from_file()
+            User.save_many(new_users(3, 'i'))
+            User.search({'email': 'h0@example.com'})[0].remove()
+            """], capture_output=True, text=True,
+                env=dict(os.environ, DB_JOURNAL_COMPACT_SIZE='1000000'))
+            assert other.returncode == 0, other.stderr
+            for user in new_users(20, 'j'):
+                user.save()
+            while base._COMPACTING:
+                time.sleep(0.01)
+            assert not os.path.exists('.db_User.journal.old')
+            print(json.dumps(dump()))
+        ''', settings)
+        emails = [user['email'] for user in saved]
+        self.assertEqual(len(saved), 27)
+        self.assertIn('i2@example.com', emails)
+        self.assertNotIn('h0@example.com', emails)
+        self.assertEqual(self.run_step('''
+            print(json.dumps(dump()))
+        ''', settings), saved)
+
+    def test_replay(self):
+        settings = MODES['journal']
+        self.run_step('''
+            User.save_many(new_users(10, 'e'))
+            User.save_to_file()     # snapshot, then only journal records
+            User.search({'email': 'e0@example.com'})[0].remove()
+            user = User.search({'email': 'e1@example.com'})[0]
+            user.last_name = 'Replayed'
+            user.save()
+        ''', settings)
+        users = self.run_step('''
+            print(json.dumps(dump()))
+        ''', settings)
+        self.assertEqual(len(users), 9)
+        self.assertEqual([user['last_name'] for user in users
+                          if user['email'] == 'e1@example.com'],
+                         ['Replayed'])
+        # a record being written (no end of line yet) is left for later
+        self.run_step('''
+            user = User(email='torn@example.com')
+            record = {'op': 'save', 'id': user.id, 'obj': user.to_json(True)}
+            with open('.db_User.journal', 'a') as f:
+                f.write(json.dumps(record))
+        ''', settings)
+        self.assertEqual(self.run_step('''
+            print(json.dumps(dump()))
+        ''', settings), users)
+        reloaded = self.run_step('''
+            dump()
+            with open('.db_User.journal', 'a') as f:
+                f.write('\\n')
+            print(json.dumps(dump()))
+        ''', settings)
+        self.assertEqual(len(reloaded), 10)
+        self.assertIn('torn@example.com',
+                      [user['email'] for user in reloaded])
+
+
+class TestCrossProcessReload(StorageTestCase):
+    """ A process reloads the changes another one wrote """
+
+    def test_reload(self):
+        for mode in ('default', 'journal', 'binary', 'compact', 'shards',
+                     'lazy_shards', 'sqlite'):
+            with self.subTest(mode=mode):
+                self.new_dir()
+                settings = MODES[mode]
+                result = self.run_step('''
+                    import subprocess
+                    User.save_many(new_users(20, 'f'))
+                    before = dump()
+                    # another process changes the files
+                    other = subprocess.run([sys.executable, '-c', """
+                    from prelude import *
+                    User.load_from_file()
+                    User.search({'email': 'f0@example.com'})[0].remove()
+                    user = User.search({'email': 'f1@example.com'})[0]
+                    user.email = 'other@example.com'
+                    user.save()
+                    User.save_many(new_users(2, 'g'))
+                    print(json.dumps(dump()))
+                    """], capture_output=True, text=True)
+                    assert other.returncode == 0, other.stderr
+                    print(json.dumps([before, json.loads(other.stdout),
+                                      dump()]))
+                ''', settings)
+                before, written, reloaded = result
+                self.assertEqual(len(before), 20)
+                self.assertEqual(len(written), 21)
+                self.assertEqual(reloaded, written)
+
+
+if __name__ == '__main__':
+    unittest.main()